@@ -0,0 +1,137 @@
+"""
+Bitboard backend for game_logic.
+
+Every player is stored as one Python int. The cell (y, x) is bit y * stride + x,
+where stride = cols + 1. The additional column is always empty and acts as a guard,
+so shifting a bitboard along a direction can never wrap around into the next row.
+
+A direction (dy, dx) becomes a shift by dy * stride + dx. Bit p of (bits >> k * shift)
+is set iff cell p + k * shift is set, so ANDing n shifted copies gives all windows of
+length n that start at p.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import numpy.typing as npt
+
+from utils.bot_utils import DIRECTIONS
+
+
+@dataclass(frozen=True)
+class Layout:
+    rows: int
+    cols: int
+    stride: int
+    shifts: tuple[int, ...]  # one shift per direction in DIRECTIONS
+
+
+@lru_cache(maxsize=None)
+def get_layout(rows: int, cols: int) -> Layout:
+    stride = cols + 1
+    shifts = tuple(dy * stride + dx for dy, dx in DIRECTIONS)
+    return Layout(rows=rows, cols=cols, stride=stride, shifts=shifts)
+
+
+def _pack(mask: npt.NDArray[np.bool_], layout: Layout) -> int:
+    padded = np.zeros((layout.rows, layout.stride), dtype=np.bool_)
+    padded[:, : layout.cols] = mask
+    return int.from_bytes(np.packbits(padded, bitorder="little").tobytes(), "little")
+
+
+def from_board(board: npt.NDArray[np.int8], player: int) -> int:
+    """
+    returns the bitboard of the given player (player = 0 returns the empty cells)
+    """
+    layout = get_layout(*board.shape)
+    return _pack(board == player, layout)
+
+
+def _windows(bits: int, n: int, shift: int) -> list[int]:
+    """
+    returns [bits, bits >> shift, ..., bits >> (n - 1) * shift]
+    """
+    return [bits >> (k * shift) for k in range(n)]
+
+
+def _and_all(values: list[int], full: int) -> int:
+    result = full
+    for v in values:
+        result &= v
+    return result
+
+
+def count_direction(
+    player_bits: int,
+    empty_bits: int,
+    n: int,
+    shift: int,
+    almost: bool,
+    longer_allowed: bool = True,
+) -> int:
+    """
+    counts the windows of length n along one direction, see game_logic.count for the definition.
+    """
+    full = (1 << (player_bits | empty_bits).bit_length()) - 1
+    stones = _windows(player_bits, n, shift)
+
+    if almost:
+        # exactly one of the n cells is empty, the rest belongs to the player
+        empties = _windows(empty_bits, n, shift)
+        prefix = [full]
+        for s in stones[:-1]:
+            prefix.append(prefix[-1] & s)
+        suffix = [full]
+        for s in reversed(stones[1:]):
+            suffix.append(suffix[-1] & s)
+        suffix.reverse()
+        starts = 0
+        for k in range(n):
+            starts |= prefix[k] & empties[k] & suffix[k]
+    else:
+        starts = _and_all(stones, full)
+
+    if not longer_allowed:
+        # the cells right before and right after the window must not belong to the player
+        starts &= ~(player_bits << shift)
+        starts &= ~(player_bits >> (n * shift))
+
+    return starts.bit_count()
+
+
+def count(
+    board: npt.NDArray[np.int8],
+    n: int,
+    player: int,
+    almost: bool,
+    longer_allowed: bool = True,
+) -> int:
+    layout = get_layout(*board.shape)
+    player_bits = _pack(board == player, layout)
+    empty_bits = _pack(board == 0, layout) if almost else 0
+    return sum(
+        count_direction(player_bits, empty_bits, n, shift, almost, longer_allowed)
+        for shift in layout.shifts
+    )
+
+
+def has_n_in_a_row(player_bits: int, n: int, layout: Layout) -> bool:
+    """
+    returns true if the bitboard contains n (or more) stones in a row
+    """
+    if player_bits == 0:
+        return False
+    for shift in layout.shifts:
+        starts = player_bits
+        for k in range(1, n):
+            starts &= player_bits >> (k * shift)
+            if not starts:
+                break
+        if starts:
+            return True
+    return False
+
+
+def has_player_won(board: npt.NDArray[np.int8], n: int, player: int) -> bool:
+    layout = get_layout(*board.shape)
+    return has_n_in_a_row(_pack(board == player, layout), n, layout)
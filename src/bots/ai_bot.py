@@ -1,18 +1,33 @@
+import weakref
+from collections import OrderedDict
 from os.path import join
 from pathlib import Path
 
 import numpy as np
 import numpy.typing as npt
 from gobang.algorithm.ai import GreedyPolicyPlayer, ProbabilisticPolicyPlayer
-from gobang.algorithm.policy import CNNPolicy
-from gobang.game import GameState
+from gobang.algorithm.policy import CachedPolicy, CNNPolicy
+from gobang.game import EMPTY, GameState
 
 bot1 = None
 bot2 = None
+policy = None
 current_file = Path(__file__)
 
 home_dir = current_file.parent.parent
-policy = CNNPolicy.load_model(join(home_dir, "models", "gobang.pth")) # CHANGED HERE!
+
+
+def get_policy() -> CachedPolicy:
+    """
+    Load the policy on first use, so importing this module stays cheap.
+
+    Frozen float32 module for cpu inference (see CNNPolicy.load_inference_model),
+    cached since self-play keeps revisiting the same openings.
+    """
+    global policy
+    if policy is None:
+        policy = CachedPolicy(CNNPolicy.load_inference_model(join(home_dir, "models", "gobang.pth")))
+    return policy
 
 
 def convert_board(board: npt.NDArray[np.int8]):
@@ -22,6 +37,60 @@ def convert_board(board: npt.NDArray[np.int8]):
     return GameState(shape, np.where(board == 2, -1, board).T, False, False)
 
 
+# one GameState per game, keyed by the id of the board array the game is played on
+# (sim_game mutates the same board in place for the whole game),
+# with a weak reference to that array, since ids are reused once an array is garbage-collected
+_game_states: OrderedDict[int, tuple[weakref.ref, GameState]] = OrderedDict()
+_MAX_GAME_STATES = 64
+# replaying more moves than this costs about as much as a full rebuild
+_MAX_REPLAY_MOVES = 4
+
+
+def _sync_game_state(state: GameState | None, board: npt.NDArray[np.int8]) -> GameState:
+    """
+    Bring state up to date with board by playing only the new stones via do_move.
+    Falls back to a full rebuild (convert_board) if the board diverged from state.
+    """
+    if state is None or state.is_end_of_game or state.board.shape != board.T.shape:
+        return convert_board(board)
+
+    target = np.where(board == 2, -1, board).T
+    changed = state.board != target
+    num_changed = int(changed.sum())
+    if num_changed == 0:
+        return state
+    if num_changed > _MAX_REPLAY_MOVES or (state.board[changed] != EMPTY).any():
+        return convert_board(board)
+
+    # the new stones have to alternate, starting with the player to move
+    own = list(zip(*np.nonzero(changed & (target == state.current_player))))
+    other = list(zip(*np.nonzero(changed & (target == -state.current_player))))
+    if len(own) - len(other) not in (0, 1):
+        return convert_board(board)
+
+    for i in range(num_changed):
+        x, y = own[i // 2] if i % 2 == 0 else other[i // 2]
+        state.do_move((int(x), int(y)))
+    return state
+
+
+def get_game_state(board: npt.NDArray[np.int8]) -> GameState:
+    """
+    Return the GameState for board, reusing (and incrementally updating)
+    the GameState of the previous call for the same board array.
+    """
+    key = id(board)
+    board_ref, state = _game_states.pop(key, (None, None))
+    if board_ref is None or board_ref() is not board:
+        # a new board (possibly at the address of a collected one), start from scratch
+        board_ref, state = weakref.ref(board), None
+    state = _sync_game_state(state, board)
+    _game_states[key] = (board_ref, state)
+    while len(_game_states) > _MAX_GAME_STATES:
+        _game_states.popitem(last=False)
+    return state
+
+
 def convert_back(game: GameState):
     board = game.board
     return np.where(board == -1, 2, board).T
@@ -30,8 +99,8 @@ def convert_back(game: GameState):
 def generate_next_move_greedy(board: npt.NDArray[np.int8]) -> tuple[int, int]:
     global bot1
     if bot1 is None:
-        bot1 = GreedyPolicyPlayer(policy)
-    res = bot1.get_move(convert_board(board))
+        bot1 = GreedyPolicyPlayer(get_policy())
+    res = bot1.get_move(get_game_state(board))
     if res is None:
         raise RuntimeError("board is full")
     x, y = res
@@ -41,14 +110,42 @@ def generate_next_move_greedy(board: npt.NDArray[np.int8]) -> tuple[int, int]:
 def generate_next_move_probabilistic(board: npt.NDArray[np.int8]) -> tuple[int, int]:
     global bot2
     if bot2 is None:
-        bot2 = ProbabilisticPolicyPlayer(policy, temperature=0.1)
-    res = bot2.get_move(convert_board(board))
+        bot2 = ProbabilisticPolicyPlayer(get_policy(), temperature=0.1)
+    res = bot2.get_move(get_game_state(board))
     if res is None:
         raise RuntimeError("board is full")
     x, y = res
     return (y, x)
 
 
+def _moves_from_bot(bot, boards: list[npt.NDArray[np.int8]]) -> list[tuple[int, int]]:
+    # one forward pass of the policy for all boards
+    res = bot.get_moves([get_game_state(board) for board in boards])
+    if any(move is None for move in res):
+        raise RuntimeError("board is full")
+    return [(y, x) for x, y in res]
+
+
+def generate_next_moves_greedy(boards: list[npt.NDArray[np.int8]]) -> list[tuple[int, int]]:
+    """
+    Batch version of generate_next_move_greedy, returns one (y, x) move per board.
+    """
+    global bot1
+    if bot1 is None:
+        bot1 = GreedyPolicyPlayer(get_policy())
+    return _moves_from_bot(bot1, boards)
+
+
+def generate_next_moves_probabilistic(boards: list[npt.NDArray[np.int8]]) -> list[tuple[int, int]]:
+    """
+    Batch version of generate_next_move_probabilistic, returns one (y, x) move per board.
+    """
+    global bot2
+    if bot2 is None:
+        bot2 = ProbabilisticPolicyPlayer(get_policy(), temperature=0.1)
+    return _moves_from_bot(bot2, boards)
+
+
 if __name__ == "__main__":
     move = generate_next_move_probabilistic(np.zeros((15, 15), dtype=np.int8))
     print(move)
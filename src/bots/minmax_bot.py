@@ -1,112 +1,391 @@
 import sys
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import numpy.typing as npt
+
+from utils.bot_utils import (
+    PATTERN_WEIGHTS,
+    SEARCH_KEYS,
+    CandidateMoves,
+    PatternEvaluator,
+    board_key,
+    zobrist_table,
+)
+
+# bound flags of a transposition table entry
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+
+class TranspositionTable:
+    """
+    Fixed-size transposition table: slot key & mask holds at most one entry,
+    stored in parallel lists (full key, depth, value, bound flag, best move as y * cols + x or -1).
+
+    Depth-preferred replacement: a slot is only overwritten by a search at least as deep,
+    unless its entry is from an older search (see new_search).
+    """
+
+    def __init__(self, size_log2: int = 18):
+        size = 1 << size_log2
+        self.mask = size - 1
+        self.keys = [0] * size
+        self.depths = [-1] * size
+        self.values = [0] * size
+        self.flags = [EXACT] * size
+        self.moves = [-1] * size
+        self.generations = [0] * size
+        self.generation = 0
+
+    def new_search(self) -> None:
+        """
+        Entries of previous searches stay valid, but may be replaced by any new entry.
+        """
+        self.generation += 1
+
+    def probe(self, key: int) -> tuple[int, int, int, int] | None:
+        """
+        Return (depth, value, flag, move) stored for key or None.
+        """
+        slot = key & self.mask
+        if self.depths[slot] < 0 or self.keys[slot] != key:
+            return None
+        return self.depths[slot], self.values[slot], self.flags[slot], self.moves[slot]
+
+    def store(self, key: int, depth: int, value: int, flag: int, move: int) -> None:
+        slot = key & self.mask
+        if depth < self.depths[slot] and self.generations[slot] == self.generation:
+            return
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.values[slot] = value
+        self.flags[slot] = flag
+        self.moves[slot] = move
+        self.generations[slot] = self.generation
 
 
 def evaluate(board: np.ndarray, us: int, them: int) -> int:
-    raise NotImplementedError("evaluate is not implemented")
+    """
+    Pattern score of the whole board from the view of us, see PatternEvaluator.
+    The search keeps a PatternEvaluator up to date instead of calling this per node.
+    """
+    return PatternEvaluator(board).score(us)
 
 
-def minimax_alpha_beta(
-    board: np.ndarray,
-    depth: int,
-    alpha: int,
-    beta: int,
-    maximizing: bool,
-    us: int,
-    them: int,
-    transposition,
-) -> tuple[int, tuple[int, int] | None]:
-    key = (board_key(board), depth, maximizing)
-    if key in transposition:
-        return transposition[key]
-
-    # stop cond
-    if has_player_won(board, 5, us):
-        return PATTERN_WEIGHTS[5], None
-    if has_player_won(board, 5, them):
-        return -PATTERN_WEIGHTS[5], None
-
-    if depth == 0:
-        val = evaluate(board, us, them)
-        return val, None
-
-    moves = generate_moves(board, radius=2)
-    if not moves:
-        return 0, None
-
-    # find recursive
-    scored_moves = []
-    for mv in moves:
-        y, x = mv
-        board[y, x] = us if maximizing else them
-        s = evaluate(board, us, them)
-        board[y, x] = 0
-        scored_moves.append((s, mv))
-
-    scored_moves.sort(reverse=maximizing, key=lambda x: x[0])
-    ordered_moves = [m[1] for m in scored_moves]
-
-    best_move = None
-
-    value = sys.maxsize * (-1 if maximizing else 1)
-    cur = us if maximizing else them
-    for y, x in ordered_moves:
-        board[y, x] = cur
-        child_score, _ = minimax_alpha_beta(
-            board,
-            depth - 1,
-            alpha,
-            beta,
-            not maximizing,
-            us,
-            them,
-            transposition,
+class _SearchAborted(Exception):
+    """
+    Raised inside the search once the time or node budget is used up.
+    """
+
+
+@dataclass
+class SearchResult:
+    move: tuple[int, int] | None
+    score: int
+    depth: int  # deepest completed iteration
+    nodes: int
+    seconds: float
+    pv: list[tuple[int, int]]  # principal variation of the deepest completed iteration
+
+    @property
+    def nodes_per_second(self) -> float:
+        return self.nodes / self.seconds if self.seconds > 0 else 0.0
+
+
+class MinimaxSearch:
+    """
+    Alpha-beta minimax from the view of us on a private copy of board.
+
+    The zobrist key, the PatternEvaluator and the CandidateMoves of the board are updated incrementally
+    for every move tried.
+    Move ordering: transposition table / principal variation move, killer moves of the ply,
+    then the evaluator's score after the move with the history heuristic as tie-break.
+    Killers and history are kept across the iterations of iterative_deepening.
+    """
+
+    # the clock is read every CHECK_INTERVAL nodes
+    CHECK_INTERVAL = 256
+
+    def __init__(self, board: np.ndarray, us: int, transposition: TranspositionTable | None = None):
+        self.root_board = board.copy()
+        self.us = us
+        self.them = (us % 2) + 1
+        self.rows, self.cols = board.shape
+        self.transposition = transposition if transposition is not None else TranspositionTable()
+        self._reset()
+        self.zobrist = zobrist_table(self.rows, self.cols)
+        self.killers: list[list[int]] = []  # two moves per ply
+        self.history = [None, [0] * self.board.size, [0] * self.board.size]  # history[player][y * cols + x]
+        self.pv: list[int] = []
+        self.nodes = 0
+        self.deadline: float | None = None
+        self.node_limit: int | None = None
+
+    def _reset(self) -> None:
+        """
+        Set board, key, evaluator and candidates back to the root position (an aborted search leaves them mid-search).
+        """
+        self.board = self.root_board.copy()
+        self.key = board_key(self.board)
+        self.evaluator = PatternEvaluator(self.board)
+        self.candidates = CandidateMoves(self.board, radius=2)
+
+    def _check_budget(self) -> None:
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise _SearchAborted
+        if self.deadline is not None and self.nodes % self.CHECK_INTERVAL == 0 and time.perf_counter() > self.deadline:
+            raise _SearchAborted
+
+    def _ordered_moves(self, moves: list[tuple[int, int]], cur: int, ply: int, first: list[int]) -> list[int]:
+        sign = 1 if cur == 1 else -1
+        history = self.history[cur]
+        delta = self.evaluator.move_delta
+        cols = self.cols
+        indices = [y * cols + x for y, x in moves]
+        # best for the player to move first
+        scored = sorted(
+            ((sign * delta(y, x, cur), history[idx], idx) for (y, x), idx in zip(moves, indices)),
+            key=lambda m: (m[0], m[1]),
+            reverse=True,
         )
-        board[y, x] = 0
-        vc = value
-        if maximizing:
-            value = max(value, child_score)
-            alpha = max(alpha, value)
+        ordered = [m[2] for m in scored]
+        killers = self.killers[ply] if ply < len(self.killers) else []
+        legal = set(indices)
+        front = [m for m in dict.fromkeys(first + killers) if m >= 0 and m in legal]
+        if front:
+            ordered = front + [m for m in ordered if m not in front]
+        return ordered
+
+    def _store_killer(self, ply: int, move: int) -> None:
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+
+    def alpha_beta(self, depth: int, ply: int, alpha: int, beta: int, maximizing: bool, on_pv: bool) -> tuple[int, int]:
+        """
+        Returns (value, best move as y * cols + x or -1).
+        on_pv: the moves so far are the principal variation of the previous iteration.
+        """
+        self.nodes += 1
+        self._check_budget()
+
+        us, them, evaluator = self.us, self.them, self.evaluator
+        tt_key = self.key ^ SEARCH_KEYS[us][maximizing]
+        tt_move = -1
+        entry = self.transposition.probe(tt_key)
+        if entry is not None:
+            tt_depth, tt_value, tt_flag, tt_move = entry
+            if tt_depth >= depth:
+                if tt_flag == EXACT:
+                    return tt_value, tt_move
+                if tt_flag == LOWER_BOUND:
+                    alpha = max(alpha, tt_value)
+                else:
+                    beta = min(beta, tt_value)
+                if alpha >= beta:
+                    return tt_value, tt_move
+
+        # stop cond
+        if evaluator.has_won(us):
+            return PATTERN_WEIGHTS[5], -1
+        if evaluator.has_won(them):
+            return -PATTERN_WEIGHTS[5], -1
+
+        if depth == 0:
+            return evaluator.score(us), -1
+
+        moves = self.candidates.moves()
+        if not moves:
+            return 0, -1
+
+        cur = us if maximizing else them
+        pv_move = self.pv[ply] if on_pv and ply < len(self.pv) else -1
+        ordered_moves = self._ordered_moves(moves, cur, ply, [pv_move, tt_move])
+
+        best_move = -1
+        alpha_orig, beta_orig = alpha, beta
+        board, cols, zobrist, candidates = self.board, self.cols, self.zobrist[cur], self.candidates
+
+        value = sys.maxsize * (-1 if maximizing else 1)
+        for idx in ordered_moves:
+            y, x = divmod(idx, cols)
+            board[y, x] = cur
+            evaluator.place(y, x, cur)
+            candidates.place(y, x)
+            self.key ^= zobrist[idx]
+            child_score, _ = self.alpha_beta(depth - 1, ply + 1, alpha, beta, not maximizing, on_pv and idx == pv_move)
+            self.key ^= zobrist[idx]
+            candidates.remove(y, x)
+            evaluator.remove(y, x, cur)
+            board[y, x] = 0
+            vc = value
+            if maximizing:
+                value = max(value, child_score)
+                alpha = max(alpha, value)
+            else:
+                value = min(value, child_score)
+                beta = min(beta, value)
+            best_move = idx if vc != value else best_move
+            if alpha >= beta:
+                self._store_killer(ply, idx)
+                self.history[cur][idx] += depth * depth
+                break
+
+        # value is only a bound if the search was cut off at the bounds it was given
+        if value <= alpha_orig:
+            flag = UPPER_BOUND
+        elif value >= beta_orig:
+            flag = LOWER_BOUND
         else:
-            value = min(value, child_score)
-            beta = min(beta, value)
-        best_move = (y, x) if vc != value else best_move
-        if alpha >= beta:
-            break
+            flag = EXACT
+        self.transposition.store(tt_key, depth, value, flag, best_move)
+        return value, best_move
 
-    transposition[key] = (value, best_move)
-    return value, best_move
+    def _principal_variation(self, first_move: int, max_len: int) -> list[int]:
+        """
+        Follow the best moves stored in the transposition table, starting with first_move.
+        """
+        pv = []
+        played = []
+        maximizing = True
+        move = first_move
+        while move >= 0 and len(pv) < max_len and self.board.flat[move] == 0:
+            cur = self.us if maximizing else self.them
+            pv.append(move)
+            played.append((move, cur))
+            self.board.flat[move] = cur
+            self.key ^= self.zobrist[cur][move]
+            maximizing = not maximizing
+            entry = self.transposition.probe(self.key ^ SEARCH_KEYS[self.us][maximizing])
+            move = entry[3] if entry is not None else -1
+        for move, cur in reversed(played):
+            self.key ^= self.zobrist[cur][move]
+            self.board.flat[move] = 0
+        return pv
 
+    def iterative_deepening(
+        self,
+        max_depth: int,
+        time_limit: float | None = None,
+        node_limit: int | None = None,
+        alpha: int = -(10**12),
+        beta: int = 10**12,
+        verbose: bool = False,
+    ) -> SearchResult:
+        """
+        Search depth 1, 2, ... max_depth, each iteration starting with the principal variation of the previous one.
 
-def find_best_move(
+        Stops when time_limit seconds or node_limit nodes are used up (depth 1 always completes)
+        and returns the result of the deepest completed iteration.
+        A new iteration is only started within the first half of time_limit.
+        """
+        start = time.perf_counter()
+        self.transposition.new_search()
+        self.nodes = 0
+        result = SearchResult(None, 0, 0, 0, 0.0, [])
+
+        for depth in range(1, max_depth + 1):
+            if depth > 1:
+                if time_limit is not None:
+                    if time.perf_counter() - start > time_limit / 2:
+                        break
+                    self.deadline = start + time_limit
+                self.node_limit = node_limit
+
+            try:
+                score, move = self.alpha_beta(depth, 0, alpha, beta, True, True)
+            except _SearchAborted:
+                self._reset()
+                break
+            finally:
+                self.deadline = None
+                self.node_limit = None
+
+            self.pv = self._principal_variation(move, depth)
+            result = SearchResult(
+                divmod(move, self.cols) if move >= 0 else None,
+                score,
+                depth,
+                self.nodes,
+                time.perf_counter() - start,
+                [divmod(m, self.cols) for m in self.pv],
+            )
+            if verbose:
+                print(
+                    f"depth {depth}: move={result.move}, score={score}, nodes={self.nodes}, "
+                    f"{result.nodes_per_second:.0f} nodes/s"
+                )
+
+            if abs(score) >= PATTERN_WEIGHTS[5]:
+                break
+
+        result.nodes = self.nodes
+        result.seconds = time.perf_counter() - start
+        return result
+
+
+def search_best_move(
     board: np.ndarray,
     us: int,
     max_depth: int,
     alpha: int = -(10**12),
     beta: int = 10**12,
-) -> tuple[tuple[int, int] | None, int]:
+    transposition: TranspositionTable | None = None,
+    time_limit: float | None = None,
+    node_limit: int | None = None,
+    verbose: bool = False,
+) -> SearchResult:
+    """
+    Returns the SearchResult (move, score, completed depth, nodes, nodes/s, ...) of MinimaxSearch.iterative_deepening.
+    """
     if sys.maxsize <= 2**32:
         raise RuntimeError("This implementation is not supported on 32-bit systems")
 
-    them = (us % 2) + 1
-    best_overall_move = None
-    best_overall_score = 0
-    transposition = {}
+    return MinimaxSearch(board, us, transposition).iterative_deepening(
+        max_depth, time_limit=time_limit, node_limit=node_limit, alpha=alpha, beta=beta, verbose=verbose
+    )
+
+
+def find_best_move(
+    board: np.ndarray,
+    us: int,
+    max_depth: int,
+    alpha: int = -(10**12),
+    beta: int = 10**12,
+    transposition: TranspositionTable | None = None,
+    time_limit: float | None = None,
+    node_limit: int | None = None,
+) -> tuple[tuple[int, int] | None, int]:
+    """
+    Returns (best move, score) of search_best_move.
+    """
+    result = search_best_move(board, us, max_depth, alpha, beta, transposition, time_limit, node_limit)
+    return result.move, result.score
 
-    # iterative deepening
-    for depth in range(1, max_depth + 1):
-        score, move = minimax_alpha_beta(
-            board, depth, alpha, beta, True, us, them, transposition
-        )
 
-        if move is not None and score >= best_overall_score:
-            best_overall_move, best_overall_score = move, score
+# shared by all moves of a process, entries of earlier positions stay valid (same evaluation)
+_transposition = TranspositionTable()
 
-        if abs(score) >= PATTERN_WEIGHTS[5]:
-            break
-    return best_overall_move, best_overall_score
+# default budget of generate_next_move_minimax, a node budget keeps the moves reproducible
+MINIMAX_MAX_DEPTH = 8
+MINIMAX_NODE_LIMIT = 20_000
 
 
-def generate_next_move_minimax(board: npt.NDArray[np.int8]) -> tuple[int, int]:
+def generate_next_move_minimax(
+    board: npt.NDArray[np.int8],
+    time_limit: float | None = None,
+    node_limit: int | None = MINIMAX_NODE_LIMIT,
+) -> tuple[int, int]:
+    """
+    Iterative deepening up to MINIMAX_MAX_DEPTH within time_limit seconds and / or node_limit nodes.
+    """
     player = 1 if (board != 0).sum() % 2 == 0 else 2
 
-    return find_best_move(board, player, 3)[0] or (0, 0)
+    result = search_best_move(
+        board, player, MINIMAX_MAX_DEPTH, transposition=_transposition, time_limit=time_limit, node_limit=node_limit
+    )
+    return result.move or (0, 0)
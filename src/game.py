@@ -9,7 +9,7 @@ import pygame.gfxdraw
 from bots.random_bot import generate_next_move_random
 from game_logic import (
     create_board,
-    get_winner,
+    get_winner_after_move,
     make_move,
     position_is_empty,
 )
@@ -211,8 +211,8 @@ class GomokuGame:
         self.last_move = (row, col)
         self.states.append(self.game.copy())
 
-        # won?
-        winner = get_winner(self.game, WIN_CONDITION)
+        # won? > only the lines through the last move can have changed
+        winner = get_winner_after_move(self.game, row, col, WIN_CONDITION)
         if winner in (PLAYER_BLACK, PLAYER_WHITE):
             self.game_over = True
             self.winner = winner
@@ -264,8 +264,8 @@ class GomokuGame:
         self.last_move = (row, col)
         self.states.append(self.game.copy())
 
-        # won?
-        winner = get_winner(self.game, WIN_CONDITION)
+        # won? > only the lines through the last move can have changed
+        winner = get_winner_after_move(self.game, row, col, WIN_CONDITION)
         if winner in (PLAYER_BLACK, PLAYER_WHITE):
             self.game_over = True
             self.winner = winner
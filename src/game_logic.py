@@ -1,6 +1,8 @@
 import numpy as np
 import numpy.typing as npt
 
+import bitboard
+from utils.bot_utils import DIRECTIONS
 from utils.game_utils import in_bounds
 
 
@@ -87,14 +89,6 @@ def count_wins2(board: npt.NDArray[np.int8], n: int, player: int) -> int:
     return wins
 
 
-def _has_player_won_helper(board: npt.NDArray[np.int8], n: int, player: int):
-    mask = (board == player).astype(int)
-    kernel = np.ones(n, dtype=int)  # dim of win condition
-
-    conv = np.convolve(mask, kernel, mode="valid")
-    return np.any(conv == n)
-
-
 def count(
     board: npt.NDArray[np.int8],
     n: int,
@@ -103,53 +97,22 @@ def count(
     longer_allowed: bool = True,
 ) -> int:
     """
-    returns true if the win condition is satisfied by the given player (n in a row), otherwise false
-    """
-    if longer_allowed:
-        func = count_almost_wins if almost else count_wins
-    else:
-        func = count_almost_wins2 if almost else count_wins2
-    counter = 0
-    size = board.shape[0]
-    for i in range(0, size):
-        col = board[:, i]
-        counter += func(col, n, player)
-        row = board[i, :]
-        counter += func(row, n, player)
+    returns the number of windows of length n (horizontal, vertical or diagonal) that
+    - almost=False: are completely occupied by the given player
+    - almost=True: are occupied by the given player except for one empty cell (4+1)
+    If longer_allowed is False, the cells right before and after the window must not belong to the player.
 
-    for offset in range(-size + n, size - n + 1):
-        diag1 = np.diag(board, k=offset)
-        counter += func(diag1, n, player)
-
-        diag2 = np.diag(np.fliplr(board), k=offset)
-        counter += func(diag2, n, player)
-    return int(counter)
+    Uses the bitboard backend, see count_wins / count_almost_wins (and the *2 variants) for the
+    definition on a single line.
+    """
+    return bitboard.count(board, n, player, almost, longer_allowed)
 
 
 def has_player_won(board: npt.NDArray[np.int8], n: int, player: int) -> bool:
     """
     returns true if the win condition is satisfied by the given player (n in a row), otherwise false
     """
-
-    # Check horizontals
-    size = board.shape[0]
-    for i in range(0, size):
-        col = board[:, i]
-        if _has_player_won_helper(col, n, player):
-            return True
-        row = board[i, :]
-        if _has_player_won_helper(row, n, player):
-            return True
-
-    # Check diagonals
-    for offset in range(-size + n, size - n + 1):
-        diag1 = np.diag(board, k=offset)
-        if _has_player_won_helper(diag1, n, player):
-            return True
-        diag2 = np.diag(np.fliplr(board), k=offset)
-        if _has_player_won_helper(diag2, n, player):
-            return True
-    return False
+    return bitboard.has_player_won(board, n, player)
 
 
 def get_winner(board: npt.NDArray[np.int8], n: int) -> int:
@@ -165,3 +128,157 @@ def get_winner(board: npt.NDArray[np.int8], n: int) -> int:
         if has_player_won(board, n, player):
             return player
     return -1 if is_board_full(board) else 0
+
+
+def _run_length(
+    board: npt.NDArray[np.int8], y: int, x: int, dy: int, dx: int, player: int
+) -> int:
+    """
+    returns the number of consecutive stones of the given player starting next to (y, x) in direction (dy, dx)
+    """
+    size_y, size_x = board.shape
+    length = 0
+    y, x = y + dy, x + dx
+    while 0 <= y < size_y and 0 <= x < size_x and board[y, x] == player:
+        length += 1
+        y, x = y + dy, x + dx
+    return length
+
+
+def has_player_won_after_move(board: npt.NDArray[np.int8], y: int, x: int, n: int) -> bool:
+    """
+    returns true if the stone at (y, x) is part of n (or more) in a row.
+    Only the four lines through (y, x) are checked.
+    """
+    player = board[y, x]
+    if player == 0:
+        return False
+
+    for dy, dx in DIRECTIONS:
+        length = (
+            1
+            + _run_length(board, y, x, dy, dx, player)
+            + _run_length(board, y, x, -dy, -dx, player)
+        )
+        if length >= n:
+            return True
+    return False
+
+
+def get_winner_after_move(board: npt.NDArray[np.int8], y: int, x: int, n: int) -> int:
+    """
+    returns the winner of the given board, assuming (y, x) is the last move that was played
+    and the game was still in progress before it.
+    Same return values as get_winner.
+    """
+    if has_player_won_after_move(board, y, x, n):
+        return int(board[y, x])
+    return -1 if is_board_full(board) else 0
+
+
+class GameTracker:
+    """
+    Keeps track of the winner of a running game.
+
+    Every move only checks the four lines through the placed stone and updates
+    the number of empty cells, instead of rescanning the whole board.
+    """
+
+    def __init__(self, board: npt.NDArray[np.int8], n: int = 5):
+        self.board = board
+        self.n = n
+        self.empty_count = int(np.count_nonzero(board == 0))
+        # full scan only once, the board might not be empty
+        self.winner = get_winner(board, n)
+
+    def make_move(self, y: int, x: int, player: int) -> int:
+        """
+        places the stone and returns the winner after this move (see get_winner)
+        """
+        if self.winner != 0:
+            raise RuntimeError("game is already over")
+        make_move(self.board, y, x, player)
+        self.empty_count -= 1
+
+        if has_player_won_after_move(self.board, y, x, self.n):
+            self.winner = player
+        elif self.empty_count == 0:
+            self.winner = -1
+        return self.winner
+
+
+def _shifted(
+    padded: npt.NDArray[np.bool_], pad: int, k: int, dy: int, dx: int, rows: int, cols: int
+) -> npt.NDArray[np.bool_]:
+    """
+    returns the view of a padded (N, rows + 2 * pad, cols + 2 * pad) array in which
+    [:, y, x] is the cell (y + k * dy, x + k * dx) of the unpadded boards
+    """
+    y0 = pad + k * dy
+    x0 = pad + k * dx
+    return padded[:, y0 : y0 + rows, x0 : x0 + cols]
+
+
+def count_batch(
+    boards: npt.NDArray[np.int8],
+    n: int,
+    players: int | npt.NDArray[np.integer],
+    almost: bool,
+    longer_allowed: bool = True,
+) -> npt.NDArray[np.int64]:
+    """
+    Batched version of count for boards of shape (N, size, size), e.g. a whole simulated game.
+    players is either one player for all boards or an array of shape (N,) with one player per board.
+
+    Returns an array of shape (N,) where entry i equals count(boards[i], n, players[i], almost, longer_allowed).
+    """
+    if boards.ndim != 3:
+        raise ValueError(f"Expected 3D array (N, size, size), got {boards.ndim}D array")
+    num_boards, rows, cols = boards.shape
+    players = np.broadcast_to(np.asarray(players), (num_boards,))
+
+    # pad by n on every side, so the cell before and after each window always exists
+    pad = n
+    stones = np.zeros((num_boards, rows + 2 * pad, cols + 2 * pad), dtype=np.bool_)
+    stones[:, pad:-pad, pad:-pad] = boards == players[:, None, None]
+    empties = np.zeros_like(stones)
+    if almost:
+        empties[:, pad:-pad, pad:-pad] = boards == 0
+
+    counts = np.zeros(num_boards, dtype=np.int64)
+    for dy, dx in DIRECTIONS:
+        # windows start at every cell, cells outside the board are neither stone nor empty
+        stone_sum = np.zeros((num_boards, rows, cols), dtype=np.int16)
+        empty_sum = np.zeros((num_boards, rows, cols), dtype=np.int16)
+        for k in range(n):
+            stone_sum += _shifted(stones, pad, k, dy, dx, rows, cols)
+            if almost:
+                empty_sum += _shifted(empties, pad, k, dy, dx, rows, cols)
+
+        if almost:
+            mask = (stone_sum == n - 1) & (empty_sum == 1)
+        else:
+            mask = stone_sum == n
+
+        if not longer_allowed:
+            mask &= ~_shifted(stones, pad, -1, dy, dx, rows, cols)
+            mask &= ~_shifted(stones, pad, n, dy, dx, rows, cols)
+
+        counts += mask.sum(axis=(1, 2))
+    return counts
+
+
+def get_winner_batch(boards: npt.NDArray[np.int8], n: int = 5) -> npt.NDArray[np.int8]:
+    """
+    Batched version of get_winner for boards of shape (N, size, size).
+    Returns an array of shape (N,) with the same values as get_winner.
+    """
+    black_won = count_batch(boards, n, 1, almost=False) > 0
+    white_won = count_batch(boards, n, 2, almost=False) > 0
+    full = ~np.any(boards == 0, axis=(1, 2))
+
+    winners = np.zeros(boards.shape[0], dtype=np.int8)
+    winners[full] = -1
+    winners[white_won] = 2
+    winners[black_won] = 1
+    return winners
@@ -44,6 +44,20 @@ def parse_args():
         help="Do not add randomness to the images (e.g. discoloration, rotation, etc.).",
     )
     parser.set_defaults(non_rand_img=False)
+    parser.add_argument(
+        "--no_img_files",
+        dest="write_images",
+        action="store_false",
+        help="Do not write the images as loose .png files, they are only stored inside the parquet file.",
+    )
+    parser.set_defaults(write_images=True)
+    parser.add_argument(
+        "--inline_images",
+        dest="image_table",
+        action="store_false",
+        help="Embed the image bytes in every row of dataset.parquet instead of storing every unique image once in a separate images.parquet (referenced via img_id).",
+    )
+    parser.set_defaults(image_table=True)
 
     return parser.parse_args()
 
@@ -86,5 +100,9 @@ if __name__ == "__main__":
             cmd.append("--no_gen_subfolder")
         if args.non_rand_img:
             cmd.append("--no_rand_img")
+        if not args.write_images:
+            cmd.append("--no_img_files")
+        if not args.image_table:
+            cmd.append("--inline_images")
 
         subprocess.run(cmd, check=True)
\ No newline at end of file
@@ -10,7 +10,7 @@ class DatasetRow:
     One row in our (eventually parquet) dataset.
     """
     img_path: str   # for easier debugging
-    img_bytes: bytes # for training
+    img_id: str # for training, reference into the image store (core.get_image_bytes) / images table
 
     family: str  # "perception" | "strategy"
     q_id: str  # "Q1", "Q2", ...
@@ -68,7 +68,13 @@ if __name__ == "__main__":
     row = subset.iloc[args.idx]
 
     # Decode and show image from img_bytes
-    img_bytes = row["img_bytes"]
+    if "img_bytes" in row:
+        img_bytes = row["img_bytes"]
+    else:
+        # written with an images table (the default), look the image up in the images.parquet next to it
+        images = pd.read_parquet(path.parent / "images.parquet")
+        matches = images.loc[images["img_id"] == row["img_id"], "img_bytes"]
+        img_bytes = matches.iloc[0] if not matches.empty else None
     if img_bytes is None:
         print("\nimg_bytes is None, cannot display image.")
         exit(1)
@@ -0,0 +1,247 @@
+# gen_dataset/parquet_writer.py
+import math
+from dataclasses import asdict
+from pathlib import Path
+from typing import Iterable, Iterator, List, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from gen_dataset.dataset_schema import DatasetRow
+from gen_dataset.sphinx import core as sphinx_core
+
+DEFAULT_ROW_GROUP_SIZE = 256
+
+# shuffle_and_split_parquet(): max. number of bucket files open at once (per pass)
+# and the default number of row groups held in memory
+MAX_SHUFFLE_BUCKETS = 64
+SHUFFLE_MEMORY_ROW_GROUPS = 8
+
+IMAGES_SCHEMA = pa.schema([
+    ("img_id", pa.string()),
+    ("img_bytes", pa.binary()),
+])
+
+
+def get_dataset_schema(image_table: bool, with_split: bool = True) -> pa.Schema:
+    """
+    Return the arrow schema of dataset.parquet.
+
+    With image_table, rows reference images.parquet via img_id instead of carrying img_bytes.
+    """
+    fields = [
+        ("img_path", pa.string()),
+        ("img_id", pa.string()) if image_table else ("img_bytes", pa.binary()),
+        ("family", pa.string()),
+        ("q_id", pa.string()),
+        ("focus", pa.string()),
+        ("answer", pa.string()),
+        ("valid_answers", pa.list_(pa.string())),
+        ("question", pa.string()),
+    ]
+    if with_split:
+        fields.append(("split", pa.string()))
+    return pa.schema(fields)
+
+
+class DatasetParquetWriter:
+    """
+    Writes DatasetRows incrementally as row groups of row_group_size rows,
+    so only one row group (and its images) is held in memory at a time.
+
+    The rows are written unshuffled and without split,
+    see shuffle_and_split_parquet() for the second pass.
+
+    Every flush resolves the images of the buffered rows from the image store
+    (sphinx_core.get_image_bytes). The store keeps them for deduplication across
+    row groups and evicts the least recently used ones itself.
+    """
+
+    def __init__(self, out_path: Path, row_group_size: int = DEFAULT_ROW_GROUP_SIZE, image_table: bool = True):
+        if row_group_size < 1:
+            raise ValueError(f"row_group_size must be >= 1, got {row_group_size}")
+
+        self.out_path = out_path
+        self.row_group_size = row_group_size
+        self.image_table = image_table
+        self.num_rows = 0
+
+        self._schema = get_dataset_schema(image_table, with_split=False)
+        self._writer = pq.ParquetWriter(out_path, self._schema)
+        self._buffer: List[DatasetRow] = []
+
+        self.images_path: Path | None = None
+        self._images_writer: pq.ParquetWriter | None = None
+        self._written_img_ids: set[str] = set()
+        if image_table:
+            self.images_path = out_path.parent / "images.parquet"
+            self._images_writer = pq.ParquetWriter(self.images_path, IMAGES_SCHEMA)
+
+    def write_rows(self, rows: Sequence[DatasetRow]) -> None:
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+
+        records = []
+        for row in self._buffer:
+            record = asdict(row)
+            record.pop("split")
+            if not self.image_table:
+                record["img_bytes"] = sphinx_core.get_image_bytes(record.pop("img_id"))
+            records.append(record)
+        self._writer.write_table(pa.Table.from_pylist(records, schema=self._schema), row_group_size=self.row_group_size)
+
+        if self._images_writer is not None:
+            new_ids = list(dict.fromkeys(
+                row.img_id for row in self._buffer if row.img_id not in self._written_img_ids
+            ))
+            if new_ids:
+                images = pa.Table.from_pydict(
+                    {"img_id": new_ids, "img_bytes": [sphinx_core.get_image_bytes(i) for i in new_ids]},
+                    schema=IMAGES_SCHEMA,
+                )
+                self._images_writer.write_table(images)
+                self._written_img_ids.update(new_ids)
+
+        self.num_rows += len(self._buffer)
+        self._buffer = []
+
+    def close(self) -> None:
+        self.flush()
+        self._writer.close()
+        if self._images_writer is not None:
+            self._images_writer.close()
+            print(f"Wrote {len(self._written_img_ids)} unique images to {self.images_path}")
+
+    def __enter__(self) -> "DatasetParquetWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def _scatter_into_buckets(
+    tables: Iterable[pa.Table],
+    schema: pa.Schema,
+    bucket_paths: Sequence[Path],
+    memory_rows: int,
+) -> None:
+    """
+    Assign every row to a random bucket file. Rows are buffered per bucket and flushed
+    once memory_rows rows are buffered in total, so every flush writes one larger row group per bucket.
+    """
+    num_buckets = len(bucket_paths)
+    writers = [pq.ParquetWriter(p, schema) for p in bucket_paths]
+    try:
+        buffers: List[List[pa.Table]] = [[] for _ in range(num_buckets)]
+        num_buffered = 0
+
+        def flush() -> None:
+            for b, parts in enumerate(buffers):
+                if parts:
+                    writers[b].write_table(pa.concat_tables(parts))
+                    parts.clear()
+
+        for table in tables:
+            buckets = np.random.randint(num_buckets, size=table.num_rows)
+            for b in np.unique(buckets):
+                buffers[b].append(table.take(np.flatnonzero(buckets == b)))
+            num_buffered += table.num_rows
+            if num_buffered >= memory_rows:
+                flush()
+                num_buffered = 0
+        flush()
+    finally:
+        for w in writers:
+            w.close()
+
+
+def _write_shuffled(
+    tables: Iterable[pa.Table],
+    num_rows: int,
+    schema: pa.Schema,
+    writer: pq.ParquetWriter,
+    tmp_prefix: Path,
+    memory_rows: int,
+    row_group_size: int,
+) -> None:
+    """
+    Shuffle the rows of tables (num_rows in total) and append them to writer.
+
+    Up to memory_rows rows are shuffled in memory. Larger inputs are scattered into at most
+    MAX_SHUFFLE_BUCKETS random bucket files, and every bucket is shuffled the same way (recursively).
+    """
+    if num_rows <= memory_rows:
+        table = pa.concat_tables(list(tables)) if num_rows else schema.empty_table()
+        writer.write_table(table.take(np.random.permutation(table.num_rows)), row_group_size=row_group_size)
+        return
+
+    num_buckets = min(MAX_SHUFFLE_BUCKETS, math.ceil(num_rows / memory_rows))
+    bucket_paths = [tmp_prefix.with_name(f"{tmp_prefix.name}_{b:03d}.parquet") for b in range(num_buckets)]
+    try:
+        _scatter_into_buckets(tables, schema, bucket_paths, memory_rows)
+        for b, p in enumerate(bucket_paths):
+            bucket = pq.ParquetFile(p)
+            _write_shuffled(
+                (pa.Table.from_batches([batch]) for batch in bucket.iter_batches(batch_size=row_group_size)),
+                bucket.metadata.num_rows,
+                schema,
+                writer,
+                tmp_prefix.with_name(f"{tmp_prefix.name}_{b:03d}"),
+                memory_rows,
+                row_group_size,
+            )
+            p.unlink()
+    finally:
+        for p in bucket_paths:
+            p.unlink(missing_ok=True)
+
+
+def shuffle_and_split_parquet(
+    in_path: Path,
+    out_path: Path,
+    splits: Sequence[str],
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    memory_rows: int | None = None,
+) -> int:
+    """
+    Second pass: add the split column (splits[i] for row i of in_path)
+    and shuffle the rows into out_path.
+
+    External shuffle: every row is scattered into one of at most MAX_SHUFFLE_BUCKETS random
+    bucket files, then each bucket is shuffled in memory (or scattered again if it is still
+    larger than memory_rows) and appended to out_path.
+    So at most memory_rows rows (default SHUFFLE_MEMORY_ROW_GROUPS row groups) are held in memory at a time.
+    """
+    if memory_rows is None:
+        memory_rows = SHUFFLE_MEMORY_ROW_GROUPS * row_group_size
+    if memory_rows < 1:
+        raise ValueError(f"memory_rows must be >= 1, got {memory_rows}")
+
+    src = pq.ParquetFile(in_path)
+    num_rows = src.metadata.num_rows
+    if len(splits) != num_rows:
+        raise ValueError(f"Expected {num_rows} splits, got {len(splits)}")
+
+    schema = src.schema_arrow.append(pa.field("split", pa.string()))
+
+    def with_splits() -> Iterator[pa.Table]:
+        offset = 0
+        for batch in src.iter_batches(batch_size=row_group_size):
+            yield pa.Table.from_batches([batch]).append_column(
+                "split", pa.array(splits[offset: offset + batch.num_rows], type=pa.string())
+            )
+            offset += batch.num_rows
+
+    with pq.ParquetWriter(out_path, schema) as writer:
+        _write_shuffled(
+            with_splits(), num_rows, schema, writer,
+            out_path.parent / f".{out_path.stem}_bucket", memory_rows, row_group_size,
+        )
+
+    return num_rows
@@ -1,19 +1,18 @@
 import argparse
 import math
 import os
-import random
 from collections import defaultdict
-from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
-from dataclasses import asdict
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Sequence, Tuple
 
 import numpy as np
-import pandas as pd
+import pyarrow.parquet as pq
 
-from bots.ai_bot import generate_next_move_greedy, generate_next_move_probabilistic
+from bots.ai_bot import generate_next_move_probabilistic, generate_next_moves_probabilistic
 from game_logic import get_winner
 from gen_dataset.dataset_schema import DatasetRow
+from gen_dataset.parquet_writer import DEFAULT_ROW_GROUP_SIZE, DatasetParquetWriter, shuffle_and_split_parquet
+from gen_dataset.simulation_service import SimulationService
 from gen_dataset.sphinx import core as sphinx_core
 from gen_dataset.sphinx.perception.per_simulation import (
     generate_perception_questions_for_episode,
@@ -118,110 +117,32 @@ def simulate_game_preferring_winner(
     return last_game
 
 
-def _simulate_one_attempt_worker(
-    bots,
-    size: int,
-    to_win: int,
-    min_final_idx: int,
-    seed: int,
-) -> Tuple[bool, int, int, np.ndarray]:
-    """
-    One attempt = one full game simulation.
-    Returns (ok, final_idx, winner, game)
+def _get_int_setting(key: str, default: int | None = None, minimum: int = 1) -> int:
     """
-    random.seed(seed)
-    np.random.seed(seed & 0xFFFFFFFF)
-
-    game = sim_game.simulate_game(bots, size, to_win)
-
-    final_idx = len(game) - 1
-    winner = get_winner(game[-1], to_win)
-    ok = (winner in (1, 2)) and (final_idx >= min_final_idx)
-
-    return ok, final_idx, winner, game
-
-def simulate_game_preferring_winner_parallel(
-    bots,
-    size: int,
-    to_win: int,
-    *,
-    max_attempts: int,
-    workers: int,
-    min_final_idx: int = 0,
-    verbose: bool = True,
-) -> np.ndarray:
-    if max_attempts < 1:
-        raise ValueError(f"max_attempts must be >= 1, got {max_attempts}")
-
-    attempts_submitted = 0
-    in_flight = set()
-
-    best_game: Optional[np.ndarray] = None
-    best_final_idx = -1
-
-    first_ok_game: Optional[np.ndarray] = None  # acts as "found_ok" flag too
-
-    def submit_one(executor) -> bool:
-        nonlocal attempts_submitted, in_flight
-        if attempts_submitted >= max_attempts:
-            return False
-        attempts_submitted += 1
-        seed = (attempts_submitted * 1_000_000_007) ^ int.from_bytes(os.urandom(8), "little")
-        in_flight.add(executor.submit(_simulate_one_attempt_worker, bots, size, to_win, min_final_idx, seed))
-        return True
-
-    with ProcessPoolExecutor(max_workers=workers) as ex:
-        for _ in range(min(workers, max_attempts)):
-            submit_one(ex)
-
-        while in_flight:
-            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
-
-            for fut in done:
-                ok, final_idx, winner, game = fut.result()
-
-                if verbose:
-                    print(f"Attempt done: winner={winner}, final_idx={final_idx}, ok={ok}")
-
-                if final_idx > best_final_idx:
-                    best_final_idx = final_idx
-                    best_game = game
-
-                # Record first acceptable game (only once)
-                if ok and first_ok_game is None:
-                    first_ok_game = game
-
-                # Only refill while we haven't found an acceptable game yet
-                if first_ok_game is None:
-                    submit_one(ex)
-
-    return first_ok_game if first_ok_game is not None else best_game
+    Read the integer setting key from [general] in sphinx_config.toml.
 
-def _get_max_simulation_attempts() -> int:
-    """
-    Read the max_simulation_attempts setting from sphinx_config.toml.
-
-    Ensures the value is explicitly set and an integer >= 1
+    Ensures the value is an integer >= minimum, defaults to default (None: the setting is required)
     """
     if sphinx_core.SPHINX_CONFIG is None:
         raise RuntimeError("SPHINX_CONFIG is not loaded. Call init_sphinx_environment() first.")
 
     general = sphinx_core.SPHINX_CONFIG.get("general") or {}
-    raw = general.get("max_simulation_attempts")
+    raw = general.get(key, default)
 
     if raw is None:
-        raise ValueError("max_simulation_attempts must be set in sphinx_config.toml under [general]")
+        raise ValueError(f"{key} must be set in sphinx_config.toml under [general]")
 
     try:
         value = int(raw)
     except (TypeError, ValueError):
-        raise ValueError(f"max_simulation_attempts must be an integer >= 1, got {raw}")
+        raise ValueError(f"{key} must be an integer >= {minimum}, got {raw}")
 
-    if value < 1:
-        raise ValueError(f"max_simulation_attempts must be an integer >= 1, got {value}")
+    if value < minimum:
+        raise ValueError(f"{key} must be an integer >= {minimum}, got {value}")
 
     return value
 
+
 def _get_num_workers() -> int:
     """
     Read the num_workers setting from sphinx_config.toml.
@@ -256,65 +177,74 @@ def _get_num_workers() -> int:
     return value
 
 
-def generate_question_dataset(non_rand_img: bool) -> List[DatasetRow]:
+def generate_question_dataset(non_rand_img: bool, writer: DatasetParquetWriter) -> None:
     """
     Simulates multiple episodes of the entire game
     and generates one of each question per episode,
-    slowly creating the entire dataset
+    slowly creating the entire dataset.
+
+    The rows of every episode are handed to the writer right away,
+    so they are not kept in memory for the whole run.
     """
     num_required_episodes = _determine_num_of_required_episodes()
     generated_questions_count: Dict[str, int] = {}
-    rows: List[DatasetRow] = []
-    max_simulation_attempts = _get_max_simulation_attempts()
+    max_simulation_attempts = _get_int_setting("max_simulation_attempts")
     num_workers = _get_num_workers()
-
-    for sim_id in range(num_required_episodes):
-        print(f"Simulating {sim_id} / {num_required_episodes}")
-
-        simulated_game = simulate_game_preferring_winner_parallel(
-        (generate_next_move_probabilistic, generate_next_move_probabilistic),
-            15, 5, max_attempts=max_simulation_attempts, workers=num_workers, min_final_idx=151,
-            verbose=True
-        )
-
-        perception_rows: List[DatasetRow] = generate_perception_questions_for_episode(
-            sim_id,
-            simulated_game,
-            generated_questions_count,
-            non_rand_img
-        )
-        rows.extend(perception_rows)
-
-        strategy_rows: List[DatasetRow] = generate_strategy_questions_for_episode(
-            sim_id,
-            simulated_game,
-            generated_questions_count,
-            non_rand_img
-        )
-        rows.extend(strategy_rows)
-
-    return rows
-
-
-def assemble_parquet_file(rows: List[DatasetRow]) -> None:
-    # convert dataclasses to dicts
-    data = [asdict(row) for row in rows]
-
-    # build DataFrame
-    df = pd.DataFrame(data)
-
-    # shuffle DataFrame
-    df = df.sample(frac=1.0).reset_index(drop=True)
+    torch_threads = _get_int_setting("torch_threads_per_worker", 1)
+    batch_size = _get_int_setting("simulation_batch_size", 1)  # 1: no lockstep batching
+
+    if batch_size > 1:
+        # every worker plays batch_size games in lockstep, one policy forward pass per step
+        bots = (generate_next_moves_probabilistic, generate_next_moves_probabilistic)
+    else:
+        bots = (generate_next_move_probabilistic, generate_next_move_probabilistic)
+
+    # the workers (and their CNN policy) are started once and keep simulating in the background,
+    # every qualifying game is buffered while the questions for the previous one are generated
+    with SimulationService(
+        bots, 15, 5, workers=num_workers, min_final_idx=151, torch_threads=torch_threads,
+        target_games=num_required_episodes, batch_size=batch_size, verbose=True,
+    ) as simulation_service:
+        for sim_id in range(num_required_episodes):
+            print(f"Simulating {sim_id} / {num_required_episodes}")
+
+            simulated_game = simulation_service.next_game(max_attempts=max_simulation_attempts)
+
+            perception_rows: List[DatasetRow] = generate_perception_questions_for_episode(
+                sim_id,
+                simulated_game,
+                generated_questions_count,
+                non_rand_img
+            )
+            writer.write_rows(perception_rows)
+
+            strategy_rows: List[DatasetRow] = generate_strategy_questions_for_episode(
+                sim_id,
+                simulated_game,
+                generated_questions_count,
+                non_rand_img
+            )
+            writer.write_rows(strategy_rows)
+
+
+def assemble_parquet_file(unshuffled_path: Path, row_group_size: int) -> None:
+    """
+    Second pass over the rows written by generate_question_dataset():
+    assign the splits, shuffle and write the final dataset.parquet.
+    """
+    # only the q_id column is loaded to compute the splits
+    q_ids = pq.read_table(unshuffled_path, columns=["q_id"]).column("q_id").to_pylist()
+    splits = compute_splits(q_ids)
 
     # get output path for Q1
     out_path = (
             sphinx_core.SPHINX_PARQUET_PATH / "dataset.parquet"
     )  # e.g. PROJECT_ROOT/dataset/sphinx/out/dataset.parquet
 
-    # write parquet
-    df.to_parquet(out_path, index=False)
+    num_rows = shuffle_and_split_parquet(unshuffled_path, out_path, splits, row_group_size)
+    unshuffled_path.unlink()
 
-    print(f"Wrote {len(df)} rows to {out_path}")
+    print(f"Wrote {num_rows} rows to {out_path}")
 
 
 def _check_train_eval_split_config(
@@ -337,9 +267,10 @@ def _check_train_eval_split_config(
         )
 
 
-def assign_splits(rows: List[DatasetRow]) -> None:
+def compute_splits(q_ids: Sequence[str]) -> List[str]:
     """
-    In-place assignment of row.split based on split_ratios in the provided sphinx_config.toml file.
+    Return the split of every row (given by its q_id, in generation order)
+    based on split_ratios in the provided sphinx_config.toml file.
     """
     ratios = sphinx_core.SPHINX_CONFIG["general"].get("split_ratios", {})
     train_r = float(ratios.get("train", 0.8))
@@ -348,10 +279,12 @@ def assign_splits(rows: List[DatasetRow]) -> None:
 
     _check_train_eval_split_config(train_r, eval_r, test_r)
 
+    splits: List[str] = [""] * len(q_ids)
+
     # Group indices by q_id
     by_qid: dict[str, list[int]] = defaultdict(list)
-    for idx, row in enumerate(rows):
-        by_qid[row.q_id].append(
+    for idx, q_id in enumerate(q_ids):
+        by_qid[q_id].append(
             idx
         )  # map q_id -> idx, where the element is found in the list
 
@@ -365,13 +298,14 @@ def assign_splits(rows: List[DatasetRow]) -> None:
 
         # Assign splits for this question
         for local_idx, row_idx in enumerate(idxs):
-            row = rows[row_idx]
             if local_idx < n_train:
-                row.split = "train"
+                splits[row_idx] = "train"
             elif local_idx < n_train + n_eval:
-                row.split = "eval"
+                splits[row_idx] = "eval"
             else:
-                row.split = "test"
+                splits[row_idx] = "test"
+
+    return splits
 
 
 def parse_args():
@@ -411,6 +345,20 @@ def parse_args():
         help="Do not add randomness to the images (e.g. discoloration, rotation, etc.).",
     )
     parser.set_defaults(non_rand_img=False)
+    parser.add_argument(
+        "--no_img_files",
+        dest="write_images",
+        action="store_false",
+        help="Do not write the images as loose .png files, they are only stored inside the parquet file.",
+    )
+    parser.set_defaults(write_images=True)
+    parser.add_argument(
+        "--inline_images",
+        dest="image_table",
+        action="store_false",
+        help="Embed the image bytes in every row of dataset.parquet instead of storing every unique image once in a separate images.parquet (referenced via img_id).",
+    )
+    parser.set_defaults(image_table=True)
 
     return parser.parse_args()
 
@@ -427,10 +375,16 @@ if __name__ == "__main__":
         questions_path=questions_path,
         output_path=output_path,
         gen_subfolder=args.gen_subfolder,
+        write_images=args.write_images,
     )
     non_rand_img = args.non_rand_img
     print("DEBUG args.non_rand_img =", args.non_rand_img)
 
-    rows = generate_question_dataset(non_rand_img)
-    assign_splits(rows)
-    assemble_parquet_file(rows)
+    row_group_size = _get_int_setting("parquet_row_group_size", DEFAULT_ROW_GROUP_SIZE)
+    # fail now instead of at the first flush, the writer resolves the images of its rows from the store
+    sphinx_core.check_image_store_size(row_group_size, len(sphinx_core.SPHINX_QUESTIONS.get("questions") or {}))
+    unshuffled_path = sphinx_core.SPHINX_PARQUET_PATH / "dataset.unshuffled.parquet"
+    with DatasetParquetWriter(unshuffled_path, row_group_size, image_table=args.image_table) as writer:
+        generate_question_dataset(non_rand_img, writer)
+    sphinx_core.wait_for_image_writes()
+    assemble_parquet_file(unshuffled_path, row_group_size)
@@ -0,0 +1,291 @@
+# gen_dataset/simulation_service.py
+import multiprocessing as mp
+import os
+import queue
+import random
+import threading
+import traceback
+from collections import deque
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+import sim_game
+from game_logic import get_winner
+
+
+def _attempt_result(game: np.ndarray, to_win: int, min_final_idx: int) -> Tuple[bool, int, int, np.ndarray]:
+    """
+    Returns (ok, final_idx, winner, game)
+    """
+    final_idx = len(game) - 1
+    winner = get_winner(game[-1], to_win)
+    ok = (winner in (1, 2)) and (final_idx >= min_final_idx)
+
+    return ok, final_idx, winner, game
+
+
+def _simulate_attempts(
+    bots,
+    size: int,
+    to_win: int,
+    min_final_idx: int,
+    seed: int,
+    num_games: int,
+) -> Iterator[Tuple[bool, int, int, np.ndarray]]:
+    """
+    One attempt = one full game simulation.
+    """
+    random.seed(seed)
+    np.random.seed(seed & 0xFFFFFFFF)
+
+    for _ in range(num_games):
+        yield _attempt_result(sim_game.simulate_game(bots, size, to_win), to_win, min_final_idx)
+
+
+def _simulate_attempt_stream(
+    task_queue, bots, size: int, to_win: int, min_final_idx: int, batch_size: int,
+) -> Iterator[Tuple[bool, int, int, np.ndarray]]:
+    """
+    Play batch_size games in lockstep (see sim_game.simulate_game_stream) for as long as the
+    task queue grants attempts: every (seed, num_games) task allows num_games more games to start.
+    A slot whose game ended is refilled right away if an attempt is available,
+    the worker only waits for tasks once all of its games are finished.
+    """
+    credits = 0
+    stopped = False
+
+    def start_game(block: bool) -> bool:
+        nonlocal credits, stopped
+        while credits == 0:
+            if stopped:
+                return False
+            try:
+                task = task_queue.get(block=block)
+            except queue.Empty:
+                return False
+            if task is None:
+                stopped = True
+                return False
+            seed, num_games = task
+            random.seed(seed)
+            np.random.seed(seed & 0xFFFFFFFF)
+            credits += num_games
+        credits -= 1
+        return True
+
+    for game in sim_game.simulate_game_stream(bots, start_game, batch_size, size, to_win):
+        yield _attempt_result(game, to_win, min_final_idx)
+
+
+def _simulation_worker(
+    task_queue, result_queue, bots, size: int, to_win: int, min_final_idx: int, torch_threads: int, batch_size: int,
+) -> None:
+    """
+    Worker loop: takes (seed, num_games) tasks from task_queue until it receives None
+    and puts (result, error) for every attempt into result_queue.
+
+    With batch_size > 1 the worker keeps one lockstep stream of games running across tasks,
+    see _simulate_attempt_stream.
+
+    The bots (and with them the CNN policy) are only loaded once per worker.
+    """
+    import torch
+
+    # every worker simulates its own games, more intra-op threads only oversubscribe the cpu
+    torch.set_num_threads(torch_threads)
+
+    if batch_size > 1:
+        try:
+            for result in _simulate_attempt_stream(task_queue, bots, size, to_win, min_final_idx, batch_size):
+                result_queue.put((result, None))
+        except Exception:
+            result_queue.put((None, traceback.format_exc()))
+        return
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        seed, num_games = task
+        try:
+            for result in _simulate_attempts(bots, size, to_win, min_final_idx, seed, num_games):
+                result_queue.put((result, None))
+        except Exception:
+            result_queue.put((None, traceback.format_exc()))
+
+
+class SimulationService:
+    """
+    Long-lived pool of simulation workers, started once per run.
+
+    The workers simulate continuously: a collector thread in the main process
+    sends one seed per attempt through a task queue and receives the finished games
+    through a result queue. Every game that qualifies (winner and min_final_idx)
+    is put into a buffer, next_game() consumes from it while the workers keep going.
+
+    Production pauses while max_buffered_games games are buffered,
+    or once target_games games are buffered or consumed.
+
+    With batch_size > 1 every worker plays batch_size games in lockstep and starts a new game
+    as soon as one ends, the bots then have to be batch functions (see sim_game.simulate_game_stream).
+    Every task grants one attempt and _in_flight counts the attempts that were granted
+    but not finished yet, so each worker gets one spare attempt to refill a slot without waiting.
+    """
+
+    def __init__(
+        self,
+        bots,
+        size: int,
+        to_win: int,
+        *,
+        workers: int,
+        min_final_idx: int = 0,
+        torch_threads: int = 1,
+        max_buffered_games: int = 64,
+        target_games: Optional[int] = None,
+        batch_size: int = 1,
+        verbose: bool = True,
+    ):
+        if workers < 1:
+            raise ValueError(f"workers must be >= 1, got {workers}")
+        if torch_threads < 1:
+            raise ValueError(f"torch_threads must be >= 1, got {torch_threads}")
+        if max_buffered_games < 1:
+            raise ValueError(f"max_buffered_games must be >= 1, got {max_buffered_games}")
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be >= 1, got {batch_size}")
+
+        self.workers = workers
+        self.max_buffered_games = max_buffered_games
+        self.target_games = target_games
+        self.batch_size = batch_size
+        self.verbose = verbose
+
+        self._task_queue = mp.Queue()
+        self._result_queue = mp.Queue()
+        self._in_flight = 0
+        self._attempts_submitted = 0
+
+        # shared with the collector thread, guarded by _cond
+        self._cond = threading.Condition()
+        self._buffer: deque[np.ndarray] = deque()
+        self._games_consumed = 0
+        self._attempts_since_game = 0  # attempts since the last qualifying game
+        self._best_game: Optional[np.ndarray] = None  # longest non-qualifying game since then
+        self._best_final_idx = -1
+        self._error: Optional[str] = None
+        self._stopping = False
+
+        self._processes = [
+            mp.Process(
+                target=_simulation_worker,
+                args=(self._task_queue, self._result_queue, bots, size, to_win, min_final_idx, torch_threads, batch_size),
+                daemon=True,
+            )
+            for _ in range(workers)
+        ]
+        for p in self._processes:
+            p.start()
+
+        self._collector = threading.Thread(target=self._collect, name="simulation_collector", daemon=True)
+        self._collector.start()
+
+    def _enough_games(self) -> bool:
+        if len(self._buffer) >= self.max_buffered_games:
+            return True
+        return self.target_games is not None and self._games_consumed + len(self._buffer) >= self.target_games
+
+    def _max_in_flight(self) -> int:
+        if self.batch_size == 1:
+            return self.workers
+        # every slot of every lockstep batch, plus one spare attempt per worker
+        return self.workers * (self.batch_size + 1)
+
+    def _submit_one(self) -> None:
+        # one task = one attempt
+        self._attempts_submitted += 1
+        seed = (self._attempts_submitted * 1_000_000_007) ^ int.from_bytes(os.urandom(8), "little")
+        self._task_queue.put((seed, 1))
+        self._in_flight += 1
+
+    def _collect(self) -> None:
+        """
+        Collector thread: keeps every worker busy and sorts the finished attempts into the buffer.
+        """
+        while True:
+            with self._cond:
+                if self._stopping or self._error is not None:
+                    return
+                while self._in_flight < self._max_in_flight() and not self._enough_games():
+                    self._submit_one()
+
+            try:
+                result, error = self._result_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            with self._cond:
+                self._in_flight -= 1
+                if error is not None:
+                    self._error = error
+                else:
+                    ok, final_idx, winner, game = result
+                    if self.verbose:
+                        print(f"Attempt done: winner={winner}, final_idx={final_idx}, ok={ok}")
+
+                    self._attempts_since_game += 1
+                    if ok:
+                        self._buffer.append(game)
+                        self._attempts_since_game = 0
+                        self._best_game = None
+                        self._best_final_idx = -1
+                    elif final_idx > self._best_final_idx:
+                        self._best_final_idx = final_idx
+                        self._best_game = game
+                self._cond.notify_all()
+
+    def next_game(self, *, max_attempts: int) -> np.ndarray:
+        """
+        Return the next buffered game that ends with a winner and reaches min_final_idx.
+        If none was found within max_attempts attempts, return the longest game instead.
+        """
+        if max_attempts < 1:
+            raise ValueError(f"max_attempts must be >= 1, got {max_attempts}")
+
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._buffer or self._error is not None or self._attempts_since_game >= max_attempts
+            )
+            if self._error is not None:
+                raise RuntimeError(f"Simulation worker failed:\n{self._error}")
+
+            self._games_consumed += 1
+            if self._buffer:
+                return self._buffer.popleft()
+
+            game = self._best_game
+            self._attempts_since_game = 0
+            self._best_game = None
+            self._best_final_idx = -1
+            self._cond.notify_all()
+            return game
+
+    def close(self) -> None:
+        with self._cond:
+            self._stopping = True
+        self._collector.join()
+
+        # the attempts still in flight are not needed anymore, a whole lockstep batch could take minutes
+        for p in self._processes:
+            p.terminate()
+        for p in self._processes:
+            p.join()
+        self._task_queue.close()
+        self._result_queue.close()
+
+    def __enter__(self) -> "SimulationService":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
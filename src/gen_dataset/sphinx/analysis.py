@@ -0,0 +1,143 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import cached_property
+
+import numpy as np
+
+import game_logic
+
+
+class GameAnalysis:
+    """
+    Per-turn facts about one simulated game, shared by all question generators.
+
+    Every table is computed lazily in one vectorized pass over the whole
+    game of shape (num_turns, board_h, board_w) and then cached, so the
+    focus helpers never have to call game_logic for a single board again.
+
+    Turn index conventions (same as in the focus modules):
+        - game[i] is the board after turn i was played.
+        - turn i was played by player 1 (black) if i is even, otherwise by player 2 (white).
+    """
+
+    def __init__(self, game: np.ndarray, n: int = 5):
+        if game.ndim != 3:
+            raise ValueError(f"Expected game of shape (num_turns, board_h, board_w), got {game.shape}")
+        self.game = game
+        self.n = n
+        self.num_turns = game.shape[0]
+
+    @cached_property
+    def last_players(self) -> np.ndarray:
+        """last_players[i]: the player who played turn i (1 or 2)."""
+        return np.where(np.arange(self.num_turns) % 2 == 0, 1, 2)
+
+    @cached_property
+    def next_players(self) -> np.ndarray:
+        """next_players[i]: the player who has to play turn i + 1 (1 or 2)."""
+        return np.where(np.arange(1, self.num_turns + 1) % 2 == 0, 1, 2)
+
+    @cached_property
+    def winners(self) -> np.ndarray:
+        """winners[i]: game_logic.get_winner of board i."""
+        return game_logic.get_winner_batch(self.game, self.n)
+
+    @property
+    def winner(self) -> int:
+        """The winner of the final board, see game_logic.get_winner."""
+        return int(self.winners[-1])
+
+    @cached_property
+    def stone_counts(self) -> np.ndarray:
+        """stone_counts[i, v]: number of cells with value v (0 = empty, 1 = black, 2 = white) on board i."""
+        return np.stack(
+            [np.count_nonzero(self.game == v, axis=(1, 2)) for v in (0, 1, 2)], axis=1
+        )
+
+    @cached_property
+    def win_threats(self) -> np.ndarray:
+        """win_threats[i]: number of 4+1 threats on board i for the player who has to play turn i + 1."""
+        return game_logic.count_batch(self.game, self.n, self.next_players, almost=True)
+
+    @cached_property
+    def lose_threats(self) -> np.ndarray:
+        """lose_threats[i]: number of 4+1 threats on board i for the opponent of the player who has to play turn i + 1."""
+        return game_logic.count_batch(self.game, self.n, self.last_players, almost=True)
+
+    @cached_property
+    def three_in_a_row(self) -> dict[int, np.ndarray]:
+        """three_in_a_row[player][i]: exact-length 3-in-a-row segments of player on board i."""
+        return {
+            player: game_logic.count_batch(self.game, 3, player, almost=False, longer_allowed=False)
+            for player in (1, 2)
+        }
+
+    @cached_property
+    def four_in_a_row(self) -> dict[int, np.ndarray]:
+        """four_in_a_row[player][i]: exact-length 4-in-a-row segments of player on board i."""
+        return {
+            player: game_logic.count_batch(self.game, 4, player, almost=False, longer_allowed=False)
+            for player in (1, 2)
+        }
+
+    @cached_property
+    def _moves(self) -> tuple[np.ndarray, np.ndarray]:
+        """(num_changes, moves): changed cells per turn and the (row, col) of the first changed cell."""
+        previous = np.zeros_like(self.game)
+        previous[1:] = self.game[:-1]
+        changed = (self.game != previous).reshape(self.num_turns, -1)
+
+        num_changes = changed.sum(axis=1)
+        rows, cols = np.divmod(changed.argmax(axis=1), self.game.shape[2])
+        return num_changes, np.stack([rows, cols], axis=1)
+
+    def move_at(self, turn_index: int) -> tuple[int, int]:
+        """
+        Return the (row, col) of the stone placed in turn turn_index,
+        i.e. the only cell that differs between board turn_index - 1 and board turn_index.
+        """
+        num_changes, moves = self._moves
+        if num_changes[turn_index] != 1:
+            raise ValueError(
+                f"Expected exactly 1 changed cell, but found {num_changes[turn_index]}. "
+            )
+        row_idx, col_idx = moves[turn_index]
+        return int(row_idx), int(col_idx)
+
+    def valid_moves(self, turn_index: int) -> np.ndarray:
+        """All empty cells [[row, col], ...] of board turn_index, in row-major order."""
+        return np.argwhere(self.game[turn_index] == 0)
+
+
+# analyses of the most recent games, keyed by the content of the game (see _game_key)
+_ANALYSIS_CACHE_SIZE = 8
+_analysis_cache: OrderedDict[tuple, GameAnalysis] = OrderedDict()
+_analysis_lock = threading.Lock()
+
+
+def _game_key(game: np.ndarray, n: int) -> tuple:
+    h = hashlib.blake2b(np.ascontiguousarray(game).tobytes(), digest_size=16)
+    return game.shape, str(game.dtype), n, h.digest()
+
+
+def get_game_analysis(game: np.ndarray, n: int = 5) -> GameAnalysis:
+    """
+    Return the GameAnalysis for the given simulated game.
+
+    The analyses of the most recent games are cached by the content of the game,
+    so all question generators of one simulation (perception and strategy) share the same tables,
+    also when they run concurrently or on a copy of the game.
+    """
+    key = _game_key(game, n)
+    with _analysis_lock:
+        analysis = _analysis_cache.get(key)
+        if analysis is not None:
+            _analysis_cache.move_to_end(key)
+            return analysis
+
+        analysis = GameAnalysis(game, n)
+        _analysis_cache[key] = analysis
+        if len(_analysis_cache) > _ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+        return analysis
@@ -1,7 +1,13 @@
+import hashlib
+import io
+import os
 import random
 import shutil
+import threading
 import tomllib
 import warnings
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from enum import Enum
 from typing import Dict
 
@@ -30,6 +36,22 @@ SPHINX_IMG_PATH: Path | None = None
 SPHINX_GAME_STATES_PATH: Path | None = None
 SPHINX_PARQUET_PATH: Path | None = None
 
+# whether to write every rendered image as a loose .png file next to the parquet file,
+# will be set via init_sphinx_environment() in runner.py
+SPHINX_WRITE_IMAGES: bool = True
+
+# bounded render/encode/write worker pool, see submit_turn_image()
+_image_pool: ThreadPoolExecutor | None = None
+_image_slots: threading.BoundedSemaphore | None = None
+_pending_image_writes: list[Future] = []
+
+# content-addressed image store: img_id -> (Future resolving to the PNG bytes, paths the image was written to),
+# every unique (board, render parameters) combination is rendered and encoded once.
+# LRU bounded by max_stored_images, see _get_image_store_size()
+_image_store: OrderedDict[str, tuple[Future, set[Path]]] = OrderedDict()
+_image_store_lock = threading.Lock()
+_image_store_size: int | None = None
+
 class QuestionFamily(str, Enum):
     PERCEPTION = "perception"
     STRATEGY = "strategy"
@@ -95,14 +117,138 @@ def _get_sim_game_state_dir(sim_id: int) -> Path:
     return sim_dir
 
 
-def persist_turn_image(
+def _get_image_pool_settings() -> tuple[int, int]:
+    """
+    Read num_image_workers and max_pending_images from [general] in sphinx_config.toml.
+
+    Both are optional, defaults are min(4, cpu cores) workers and 8 pending images per worker.
+    """
+    general = (SPHINX_CONFIG or {}).get("general") or {}
+
+    num_workers = general.get("num_image_workers", min(4, os.cpu_count() or 1))
+    if not isinstance(num_workers, int) or num_workers < 1:
+        raise ValueError(f"num_image_workers must be an int >= 1, got {num_workers!r}")
+
+    max_pending = general.get("max_pending_images", 8 * num_workers)
+    if not isinstance(max_pending, int) or max_pending < 1:
+        raise ValueError(f"max_pending_images must be an int >= 1, got {max_pending!r}")
+
+    return num_workers, max_pending
+
+
+def _get_image_store_size() -> int:
+    """
+    Read max_stored_images from [general] in sphinx_config.toml (optional, default 1024).
+
+    It has to cover every image referenced by rows that are not yet written to the parquet file,
+    see check_image_store_size().
+    """
+    global _image_store_size
+
+    if _image_store_size is None:
+        general = (SPHINX_CONFIG or {}).get("general") or {}
+        size = general.get("max_stored_images", 1024)
+        if not isinstance(size, int) or size < 1:
+            raise ValueError(f"max_stored_images must be an int >= 1, got {size!r}")
+        _image_store_size = size
+    return _image_store_size
+
+
+def check_image_store_size(row_group_size: int, rows_per_episode: int) -> None:
+    """
+    Raise a ValueError if max_stored_images can not hold the images of every row that is not written yet.
+
+    The parquet writer buffers less than row_group_size rows plus the rows of one episode,
+    every row references one image and (with SPHINX_WRITE_IMAGES) at most one debug render.
+    Rows resolve their images by img_id at flush time, so an evicted image would fail the run there.
+    """
+    images_per_row = 2 if SPHINX_WRITE_IMAGES else 1
+    required = images_per_row * (row_group_size - 1 + rows_per_episode)
+    size = _get_image_store_size()
+    if size < required:
+        raise ValueError(
+            f"max_stored_images={size} is too small for parquet_row_group_size={row_group_size} "
+            f"and {rows_per_episode} questions per episode, it has to be at least {required}"
+        )
+
+
+def _get_image_pool() -> tuple[ThreadPoolExecutor, threading.BoundedSemaphore]:
+    global _image_pool, _image_slots
+
+    if _image_pool is None:
+        num_workers, max_pending = _get_image_pool_settings()
+        _image_pool = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="sphinx_image")
+        _image_slots = threading.BoundedSemaphore(max_pending)
+    return _image_pool, _image_slots
+
+
+def _render_turn_image(board: np.ndarray, img_path: Path | None, render_kwargs: dict) -> bytes:
+    """
+    Worker job: render and encode the board, then write it to img_path (if not None).
+    """
+    img = sim_game.render_game_step(board, **render_kwargs)
+
+    # encode once in memory, the same bytes go into the parquet file and onto disk
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    img_bytes = buffer.getvalue()
+
+    if img_path is not None:
+        img_path.write_bytes(img_bytes)
+
+    return img_bytes
+
+
+def get_image_id(board: np.ndarray, render_kwargs: dict) -> str:
+    """
+    Return the content address of a render: a hash over the board and the render parameters.
+    """
+    h = hashlib.blake2b(digest_size=8)
+    h.update(repr(board.shape).encode())
+    h.update(np.ascontiguousarray(board, dtype=np.int8).tobytes())
+    h.update(repr(sorted(render_kwargs.items())).encode())
+    return h.hexdigest()
+
+
+def _submit_image_job(fn, *args) -> Future:
+    """
+    Submit fn(*args) to the background image pool, blocks while max_pending_images jobs are in flight.
+    """
+    pool, slots = _get_image_pool()
+    slots.acquire()
+    try:
+        fut = pool.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    fut.add_done_callback(lambda _: slots.release())
+    return fut
+
+
+def _write_stored_image(img_fut: Future, img_path: Path) -> None:
+    """
+    Worker job: write an already submitted image to another path.
+    """
+    img_path.write_bytes(img_fut.result())
+
+
+def submit_turn_image(
         board: np.ndarray,
         turn_index: int,
         sim_id: int,
         *,
-        non_rand_img: bool) -> tuple[Path, bytes]:
+        non_rand_img: bool) -> tuple[Path, str]:
     """
-    Renders the provided board as a .png image and then saves it.
+    Adds the provided board to the content-addressed image store.
+
+    If the same board was already rendered with the same parameters (always the case
+    for repeated boards with non_rand_img), the stored image bytes are reused and only written
+    to the directory of this simulation. Otherwise the board is submitted to the background
+    render/encode/write pool.
+
+    The random image alterations are drawn on the calling thread, so a seeded run
+    stays reproducible. If max_pending_images jobs are already in flight,
+    this blocks until one of them is finished.
 
     Args:
         board: (np.ndarray): The 2D-board of the turn.
@@ -111,21 +257,104 @@ def persist_turn_image(
         non_rand_img: (bool) Whether to exclude image alterations, like rotation or discoloration from the image rendering process.
 
     Returns:
-        tuple[Path, bytes]: A tuple containing:
-            - Path: The path of the copied image in the output directory.
-            - bytes: The PNG-encoded image bytes.
+        tuple[Path, str]: A tuple containing:
+            - Path: The path of the image in the output directory
+              (only written if SPHINX_WRITE_IMAGES, see wait_for_image_writes()).
+            - str: The img_id of the image, see get_image_bytes().
+    """
+    render_kwargs = {} if non_rand_img else sim_game.random_render_params()
+    img_id = get_image_id(board, render_kwargs)
+
+    filename = f"turn_{turn_index:03d}_{img_id}.png"
+    if SPHINX_WRITE_IMAGES:
+        img_path = _get_sim_image_dir(sim_id) / filename
+    else:
+        if SPHINX_IMG_PATH is None:
+            raise RuntimeError("init_output_dirs() must be called first")
+        img_path = SPHINX_IMG_PATH / f"sim_{sim_id:04d}" / filename
+
+    with _image_store_lock:
+        stored = _image_store.get(img_id)
+        if stored is not None:
+            _image_store.move_to_end(img_id)
+    if stored is not None:
+        img_fut, written_paths = stored
+        if SPHINX_WRITE_IMAGES and img_path not in written_paths:
+            written_paths.add(img_path)
+            _track_image_write(_submit_image_job(_write_stored_image, img_fut, img_path))
+        return img_path, img_id
+
+    img_fut = _submit_image_job(_render_turn_image, board, img_path if SPHINX_WRITE_IMAGES else None, render_kwargs)
+    with _image_store_lock:
+        _image_store[img_id] = (img_fut, {img_path})
+        while len(_image_store) > _get_image_store_size():
+            _image_store.popitem(last=False)
+    if SPHINX_WRITE_IMAGES:
+        _track_image_write(img_fut)
+
+    return img_path, img_id
+
+
+def get_image_bytes(img_id: str) -> bytes:
+    """
+    Return the PNG-encoded bytes of a stored image, blocks until it is rendered.
+    """
+    with _image_store_lock:
+        stored = _image_store.get(img_id)
+    if stored is None:
+        raise RuntimeError(
+            f"Image {img_id} is no longer in the image store, max_stored_images has to be larger "
+            f"than the number of images referenced by unwritten rows."
+        )
+    return stored[0].result()
+
+
+def persist_turn_image(
+        board: np.ndarray,
+        turn_index: int,
+        sim_id: int,
+        *,
+        non_rand_img: bool) -> tuple[Path, bytes]:
+    """
+    Blocking variant of submit_turn_image(), returns the path and the PNG-encoded image bytes.
     """
-    filename = f"turn_{turn_index:03d}.png"
-    img_path = _get_sim_image_dir(sim_id) / filename
-    # img = sim_game.render_game_step(board)
-    img = sim_game.render_game_step_rand(board, non_rand=non_rand_img)
-    img.save(img_path)
+    img_path, img_id = submit_turn_image(board, turn_index, sim_id, non_rand_img=non_rand_img)
+    return img_path, get_image_bytes(img_id)
 
-    # read image bytes (PNG-encoded)
-    with open(img_path, "rb") as f:
-        img_bytes = f.read()
 
-    return img_path, img_bytes
+def persist_debug_turn_image(board: np.ndarray, turn_index: int, sim_id: int) -> None:
+    """
+    Fire-and-forget render of a board that is only written to disk for debugging
+    (e.g. the board after the answer move). Does nothing if SPHINX_WRITE_IMAGES is not set.
+    """
+    if SPHINX_WRITE_IMAGES:
+        submit_turn_image(board, turn_index, sim_id, non_rand_img=True)
+
+
+def _track_image_write(fut: Future) -> None:
+    global _pending_image_writes
+
+    # drop finished writes, surface errors as early as possible
+    still_pending = []
+    for pending in _pending_image_writes:
+        if pending.done():
+            pending.result()
+        else:
+            still_pending.append(pending)
+    still_pending.append(fut)
+    _pending_image_writes = still_pending
+
+
+def wait_for_image_writes() -> None:
+    """
+    Block until all images submitted by submit_turn_image() are written to disk.
+    Re-raises the first error that occurred while rendering or writing.
+    """
+    global _pending_image_writes
+
+    pending, _pending_image_writes = _pending_image_writes, []
+    for fut in pending:
+        fut.result()
 
 
 def persist_turn_game_state(board: np.ndarray, turn_index: int, sim_id: int) -> Path:
@@ -175,7 +404,8 @@ def _init_output_dirs(gen_subfolder: bool = True) -> None:
     game_states_dir = dataset_root / "game_states"
     parquet_dir = dataset_root / "parquet"
 
-    img_dir.mkdir(parents=True, exist_ok=True)
+    if SPHINX_WRITE_IMAGES:
+        img_dir.mkdir(parents=True, exist_ok=True)
     game_states_dir.mkdir(parents=True, exist_ok=True)
     parquet_dir.mkdir(parents=True, exist_ok=True)
 
@@ -191,14 +421,19 @@ def init_sphinx_environment(
     questions_path: Path | str = DEFAULT_SPHINX_QUESTION_PATH,
     output_path: Path | str = DEFAULT_SPHINX_OUT_ROOT_PATH,
     gen_subfolder: bool = True,
+    write_images: bool = True,
 ) -> None:
     """
     Load the sphinx_config TOML, initialize all SPHINX_* paths,
     create a fresh dataset_NNN structure.
 
+    If write_images is False, no loose .png files are written,
+    the images are only stored inside the parquet file.
+
     Intended to be called once from runner.py.
     """
     global SPHINX_CONFIG, SPHINX_CONFIG_PATH, SPHINX_QUESTIONS, SPHINX_QUESTIONS_PATH, SPHINX_OUT_ROOT_PATH
+    global SPHINX_WRITE_IMAGES
 
     config_path = Path(config_path)
     questions_path = Path(questions_path)
@@ -219,6 +454,7 @@ def init_sphinx_environment(
     SPHINX_CONFIG_PATH = config_path
     SPHINX_QUESTIONS_PATH = questions_path
     SPHINX_OUT_ROOT_PATH = output_path
+    SPHINX_WRITE_IMAGES = write_images
 
     _init_output_dirs(gen_subfolder)
 
@@ -2,10 +2,10 @@ import random
 
 import numpy as np
 
-import game_logic
 from gen_dataset.dataset_schema import DatasetRow
+from gen_dataset.sphinx.analysis import get_game_analysis
 from gen_dataset.sphinx.core import (
-    QuestionFamily, persist_turn_image, get_question_text, get_random_turn_index
+    QuestionFamily, submit_turn_image, get_question_text, get_random_turn_index
 )
 
 
@@ -41,6 +41,10 @@ def _focus_can_you_lose(
     lo = 0
     hi = num_turns - 2  # last valid "before board" index (must have a next turn)
 
+    # Number of 4+1 threats on board i for the opponent of the player to move,
+    # computed once per simulation instead of once per resample
+    lose_threats = get_game_analysis(game).lose_threats
+
     target_can_lose = (random.random() < 0.5)
 
     chosen_idx: int | None = None
@@ -61,9 +65,8 @@ def _focus_can_you_lose(
 
         next_turn_idx = idx + 1
         player = 1 if (next_turn_idx % 2 == 0) else 2
-        opponent = 2 if player == 1 else 1
 
-        can_lose = (game_logic.count(board, 5, opponent, almost=True) > 0)
+        can_lose = bool(lose_threats[idx] > 0)
 
         if can_lose == target_can_lose:
             chosen_idx = idx
@@ -79,20 +82,19 @@ def _focus_can_you_lose(
 
         next_turn_idx = idx + 1
         player = 1 if (next_turn_idx % 2 == 0) else 2
-        opponent = 2 if player == 1 else 1
 
-        can_lose = (game_logic.count(board, 5, opponent, almost=True) > 0)
+        can_lose = bool(lose_threats[idx] > 0)
 
         chosen_idx, chosen_player, chosen_board, chosen_can_lose = idx, player, board, can_lose
 
     color = "black" if chosen_player == 1 else "white"
-    img_path, img_bytes = persist_turn_image(chosen_board, chosen_idx, sim_id, non_rand_img=non_rand_img)
+    img_path, img_id = submit_turn_image(chosen_board, chosen_idx, sim_id, non_rand_img=non_rand_img)
 
     answer = "yes" if chosen_can_lose else "no"
 
     return chosen_player, color, chosen_can_lose, DatasetRow(
         img_path=str(img_path),
-        img_bytes=img_bytes,
+        img_id=img_id,
         family=FAMILY,
         q_id=q_id,
         focus=FOCUS,
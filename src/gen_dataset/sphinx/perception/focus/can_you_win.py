@@ -2,10 +2,10 @@ import random
 
 import numpy as np
 
-import game_logic
 from gen_dataset.dataset_schema import DatasetRow
+from gen_dataset.sphinx.analysis import get_game_analysis
 from gen_dataset.sphinx.core import (
-    QuestionFamily, persist_turn_image, get_question_text, get_random_turn_index
+    QuestionFamily, submit_turn_image, persist_debug_turn_image, get_question_text, get_random_turn_index
 )
 
 
@@ -48,9 +48,12 @@ def _focus_can_you_win(
         raise ValueError(f"Need at least 3 turns for {FOCUS}, got num_turns={num_turns} instead.")
 
     last_turn = game.shape[0] - 1
-    end_board = game[last_turn]
 
-    winner = game_logic.get_winner(end_board, 5)
+    # Number of 4+1 threats on board i for the player who has to play turn i + 1,
+    # computed once per simulation instead of once per resample
+    analysis = get_game_analysis(game)
+    winner = analysis.winner
+    win_threats = analysis.win_threats
 
     if winner == -1 or winner == 0:
         can_win = False # Game ended in a draw, or is somehow still in progress, assume no winning opportunity occurred
@@ -78,31 +81,31 @@ def _focus_can_you_win(
             player = 1 if (after_idx % 2 == 0) else 2
             # Break out of the for-loop if no winning position is possible
             # (i.e. guaranteed that no miss play by the bots occurred)
-            if game_logic.count(before_board, 5, player, almost=True) <= 0:
+            if win_threats[before_idx] <= 0:
                 found = True
                 break
 
         if not found:
             # Fallback, at least assign the correct label
-            can_win = game_logic.count(before_board, 5, player, almost=True) > 0
+            can_win = bool(win_threats[before_idx] > 0)
 
     # Raise runtime error if labels are incorrect
-    if (not can_win and game_logic.count(before_board, 5, player, almost=True)
-    or can_win and not game_logic.count(before_board, 5, player, almost=True)):
+    if (not can_win and win_threats[before_idx]
+    or can_win and not win_threats[before_idx]):
         raise RuntimeError(f"Invalid lables in focus {FOCUS}."
-                           f"Answer to the question \"can_you_win\" is: {game_logic.count(before_board, 5, player, almost=True)},"
+                           f"Answer to the question \"can_you_win\" is: {win_threats[before_idx]},"
                            f"but has been classified as {can_win} for turn {before_idx} -> {after_idx}.")
 
-    # Persist the image and get img_bytes
-    img_path, img_bytes = persist_turn_image(before_board, before_idx, sim_id, non_rand_img=non_rand_img)
+    # Persist the image and get its img_id
+    img_path, img_id = submit_turn_image(before_board, before_idx, sim_id, non_rand_img=non_rand_img)
     # Persist after board for debugging only
-    _, _ = persist_turn_image(after_board, after_idx, sim_id, non_rand_img=True)
+    persist_debug_turn_image(after_board, after_idx, sim_id)
     color = "black" if player == 1 else "white"
     answer = "yes" if can_win else "no"
 
     return player, color, can_win, DatasetRow(
         img_path=str(img_path),
-        img_bytes=img_bytes,
+        img_id=img_id,
         family=FAMILY,
         q_id=q_id,
         focus=FOCUS,
@@ -6,7 +6,7 @@ from gen_dataset.dataset_schema import DatasetRow
 from gen_dataset.sphinx.core import (
     QuestionFamily,
     get_random_turn_index,
-    persist_turn_image,
+    submit_turn_image,
     persist_turn_game_state,
     get_question_text
 )
@@ -35,8 +35,8 @@ def _focus_color_at_position(
     # Sample random turn
     turn_index = get_random_turn_index(game, min_turns, max_turns)
     board = game[turn_index]
-    # Persist the image and get img_bytes
-    img_path, img_bytes = persist_turn_image(board, turn_index, sim_id, non_rand_img=non_rand_img)
+    # Persist the image and get its img_id
+    img_path, img_id = submit_turn_image(board, turn_index, sim_id, non_rand_img=non_rand_img)
     # Persist game state for easier debugging
     persist_turn_game_state(board, turn_index, sim_id)
 
@@ -65,7 +65,7 @@ def _focus_color_at_position(
 
     row = DatasetRow(
         img_path=str(img_path),
-        img_bytes=img_bytes,
+        img_id=img_id,
 
         family=FAMILY,
         q_id=q_id,
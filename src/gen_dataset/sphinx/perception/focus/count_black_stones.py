@@ -1,10 +1,11 @@
 import numpy as np
 
 from gen_dataset.dataset_schema import DatasetRow
+from gen_dataset.sphinx.analysis import get_game_analysis
 from gen_dataset.sphinx.core import (
     QuestionFamily,
     get_random_turn_index,
-    persist_turn_image,
+    submit_turn_image,
     persist_turn_game_state,
     get_question_text
 )
@@ -27,19 +28,19 @@ def _focus_count_black_stones(
     # Sample random turn
     turn_index = get_random_turn_index(game, min_turns, max_turns)
     board = game[turn_index]
-    # Persist the image and get img_bytes
-    img_path, img_bytes = persist_turn_image(board, turn_index, sim_id, non_rand_img=non_rand_img)
+    # Persist the image and get its img_id
+    img_path, img_id = submit_turn_image(board, turn_index, sim_id, non_rand_img=non_rand_img)
     # Persist game state for easier debugging
     persist_turn_game_state(board, turn_index, sim_id)
 
     # count black stones (=1) as ground truth
-    num_black = int(np.count_nonzero(board == 1))
+    num_black = int(get_game_analysis(game).stone_counts[turn_index, 1])
     answer = str(num_black)
     valid_answers = [answer]
 
     return DatasetRow(
         img_path=str(img_path),
-        img_bytes=img_bytes,
+        img_id=img_id,
 
         family=FAMILY,
         q_id=q_id,
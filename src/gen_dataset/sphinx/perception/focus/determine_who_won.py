@@ -1,14 +1,14 @@
 import numpy as np
 
 from gen_dataset.dataset_schema import DatasetRow
+from gen_dataset.sphinx.analysis import get_game_analysis
 from gen_dataset.sphinx.core import (
     QuestionFamily,
     get_random_turn_index,
-    persist_turn_image,
+    submit_turn_image,
     persist_turn_game_state,
     get_question_text
 )
-from src import game_logic
 
 
 def _focus_determine_who_won(
@@ -29,11 +29,11 @@ def _focus_determine_who_won(
     # choose last turn, get board
     last_turn = game.shape[0] - 1
     board = game[last_turn]
-    # Persist the image and get img_bytes
-    img_path, img_bytes = persist_turn_image(board, last_turn, sim_id, non_rand_img=non_rand_img)
+    # Persist the image and get its img_id
+    img_path, img_id = submit_turn_image(board, last_turn, sim_id, non_rand_img=non_rand_img)
 
     # Determine winner for ground truth answer
-    winner = game_logic.get_winner(board, 5)
+    winner = get_game_analysis(game).winner
     match winner:
         case 1:
             answer = "black"
@@ -49,7 +49,7 @@ def _focus_determine_who_won(
 
     return DatasetRow(
         img_path=str(img_path),
-        img_bytes=img_bytes,
+        img_id=img_id,
 
         family=FAMILY,
         q_id=q_id,
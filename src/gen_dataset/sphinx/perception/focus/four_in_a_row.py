@@ -2,10 +2,10 @@ import random
 
 import numpy as np
 
-import game_logic
 from gen_dataset.dataset_schema import DatasetRow
+from gen_dataset.sphinx.analysis import get_game_analysis
 from gen_dataset.sphinx.core import (
-    QuestionFamily, persist_turn_image, get_random_turn_index, get_question_text
+    QuestionFamily, submit_turn_image, get_random_turn_index, get_question_text
 )
 
 
@@ -51,15 +51,15 @@ def _focus_four_in_a_row(
 
     idx = get_random_turn_index(game, min_turn, max_turn)
     board = game[idx]
-    num_four_in_a_row = game_logic.count(board, 4, player, almost=False, longer_allowed=False)
+    num_four_in_a_row = int(get_game_analysis(game).four_in_a_row[player][idx])
     answer = str(num_four_in_a_row)
 
-    # Persist the image and get img_bytes
-    img_path, img_bytes = persist_turn_image(board, idx, sim_id, non_rand_img=non_rand_img)
+    # Persist the image and get its img_id
+    img_path, img_id = submit_turn_image(board, idx, sim_id, non_rand_img=non_rand_img)
 
     return player, color, num_four_in_a_row, DatasetRow(
         img_path=str(img_path),
-        img_bytes=img_bytes,
+        img_id=img_id,
         family=FAMILY,
         q_id=q_id,
         focus=FOCUS,
@@ -1,10 +1,13 @@
 import numpy as np
 
+from threat_search import five_moves, solve_vcf
 from gen_dataset.dataset_schema import DatasetRow
+from gen_dataset.sphinx.analysis import get_game_analysis
 from gen_dataset.sphinx.core import (
     QuestionFamily,
     get_random_turn_index,
-    persist_turn_image,
+    submit_turn_image,
+    persist_debug_turn_image,
     get_question_text
 )
 
@@ -54,39 +57,45 @@ def _focus_best_next_move(
 
     # get board before performing the turn
     board = game[turn_index]
-    # Persist the image and get img_bytes
-    img_path, img_bytes = persist_turn_image(board, turn_index, sim_id, non_rand_img=non_rand_img)
+    # Persist the image and get its img_id
+    img_path, img_id = submit_turn_image(board, turn_index, sim_id, non_rand_img=non_rand_img)
 
     # also get the next board (to determine the actually performed move by the bot)
     board_after = game[next_turn]
     # persist the image for debugging only, not for the dataset
-    persist_turn_image(board_after, next_turn, sim_id, non_rand_img=True)
-
-    # compare boards to get target (row, col)
-    mask = board != board_after  # shape (15, 15)
-    changed_positions = np.argwhere(mask)  # shape (N, 2)
-    num_changes = changed_positions.shape[0]
-    if num_changes != 1:
-        raise ValueError(
-            f"Expected exactly 1 changed cell, but found {num_changes}. "
-        )
-
-    # (row, col) in 0-based indexing
-    row_idx, col_idx = changed_positions[0]
+    persist_debug_turn_image(board_after, next_turn, sim_id)
+
+    # the only changed cell between the two boards is the target (row, col) in 0-based indexing
+    row_idx, col_idx = get_game_analysis(game).move_at(next_turn)
+
+    # The played move is the answer. Moves proven to win are accepted as well:
+    # every move completing five, otherwise the first move of a forced win by continuous fours (VCF)
+    player = 1 if next_turn % 2 == 0 else 2
+    moves = [(row_idx, col_idx)]
+    winning_moves = five_moves(board, player)
+    if not winning_moves:
+        vcf = solve_vcf(board, player)
+        if vcf.win:
+            winning_moves = [vcf.move]
+    moves += [m for m in winning_moves if m != (row_idx, col_idx)]
 
     # Build the answer as a string.
     # space-separated "row col" in 0-based indices.
     answer = f"{row_idx} {col_idx}"
     # Different answer formats
     valid_answers = [
-        answer,  # "r c"
-        f"{row_idx},{col_idx}",  # "r,c"
-        f"({row_idx}, {col_idx})"  # "(r, c)"
+        formatted
+        for r, c in moves
+        for formatted in (
+            f"{r} {c}",  # "r c"
+            f"{r},{c}",  # "r,c"
+            f"({r}, {c})"  # "(r, c)"
+        )
     ]
 
     return color, DatasetRow(
         img_path=str(img_path),
-        img_bytes=img_bytes,
+        img_id=img_id,
 
         family=FAMILY,
         q_id=q_id,
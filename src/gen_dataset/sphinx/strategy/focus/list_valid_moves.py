@@ -1,14 +1,14 @@
 import numpy as np
 
 from gen_dataset.dataset_schema import DatasetRow
+from gen_dataset.sphinx.analysis import get_game_analysis
 from gen_dataset.sphinx.core import (
     QuestionFamily,
     get_random_turn_index,
-    persist_turn_image,
+    submit_turn_image,
     persist_turn_game_state,
     get_question_text
 )
-from src import game_logic
 
 def _focus_list_valid_moves(
     q_id: str,
@@ -45,8 +45,8 @@ def _focus_list_valid_moves(
     turn_index = get_random_turn_index(game, min_turns, max_turns)
 
     # Make sure the game is not already finished at this position.
-    board_at_turn = game[turn_index]
-    winner = game_logic.get_winner(board_at_turn, 5)
+    analysis = get_game_analysis(game)
+    winner = analysis.winners[turn_index]
     if winner != 0:
         # If the game already ended at this turn:
         if turn_index == 0:
@@ -59,18 +59,14 @@ def _focus_list_valid_moves(
 
     # get board for this turn_index
     board = game[turn_index]
-    # Persist the image and get img_bytes
-    img_path, img_bytes = persist_turn_image(board, turn_index, sim_id, non_rand_img=non_rand_img)
+    # Persist the image and get its img_id
+    img_path, img_id = submit_turn_image(board, turn_index, sim_id, non_rand_img=non_rand_img)
 
-    # All valid moves are all empty cells (0)
-    mask = board == 0
-    valid_moves = np.argwhere(mask)  # [[row, col], ...]
+    # All valid moves are all empty cells (0), in row-major order
+    valid_moves = analysis.valid_moves(turn_index)  # [[row, col], ...]
     if valid_moves.size == 0:
         raise ValueError("Expected at least one valid move, but found none (board full).")
 
-    # Row-major order
-    valid_moves = valid_moves[np.lexsort((valid_moves[:, 1], valid_moves[:, 0]))]
-
     # Atomic answers: each move is its own answer unit
     valid_answers = [f"{r} {c}" for r, c in valid_moves]
 
@@ -86,7 +82,7 @@ def _focus_list_valid_moves(
 
     return color, DatasetRow(
         img_path=str(img_path),
-        img_bytes=img_bytes,
+        img_id=img_id,
 
         family=FAMILY,
         q_id=q_id,
@@ -2,12 +2,13 @@ import random
 
 import numpy as np
 
-import game_logic
 from gen_dataset.dataset_schema import DatasetRow
+from gen_dataset.sphinx.analysis import get_game_analysis
 from gen_dataset.sphinx.core import (
     QuestionFamily,
     get_random_turn_index,
-    persist_turn_image,
+    submit_turn_image,
+    persist_debug_turn_image,
     get_question_text
 )
 from gen_dataset.sphinx.perception.focus.print_board_matrix import board_to_matrix_string
@@ -66,49 +67,40 @@ def _focus_reason_next_move(
     if next_turn % 2 == 0:
         player = 1
         color = "black"
-        opposite_player = 2
     else:
         player = 2
         color = "white"
-        opposite_player = 1
 
     # get board before performing the turn
     board = game[turn_index]
-    # Persist the image and get img_bytes
-    img_path, img_bytes = persist_turn_image(board, turn_index, sim_id, non_rand_img=non_rand_img)
+    # Persist the image and get its img_id
+    img_path, img_id = submit_turn_image(board, turn_index, sim_id, non_rand_img=non_rand_img)
 
     # also get the next board (to determine the actually performed move by the bot)
     board_after = game[next_turn]
     # persist the image for debugging only, not for the dataset
-    persist_turn_image(board_after, next_turn, sim_id, non_rand_img=True)
+    persist_debug_turn_image(board_after, next_turn, sim_id)
 
     # Part 1) Print the board matrix
     board_as_matrix_string = board_to_matrix_string(board)
 
+    analysis = get_game_analysis(game)
+
     # Part 2) Can you win
-    if game_logic.count(board, 5, player, True) > 0:
+    if analysis.win_threats[turn_index] > 0:
         can_win = True
     else:
         can_win = False
 
     # Part 3) Can you lose
-    if game_logic.count(board, 5, opposite_player, True) > 0:
+    if analysis.lose_threats[turn_index] > 0:
         can_lose = True
     else:
         can_lose = False
 
     # Part 4) Best next move
-    # compare boards to get target (row, col)
-    mask = board != board_after  # shape (15, 15)
-    changed_positions = np.argwhere(mask)  # shape (N, 2)
-    num_changes = changed_positions.shape[0]
-    if num_changes != 1:
-        raise ValueError(
-            f"Expected exactly 1 changed cell, but found {num_changes}. "
-        )
-
-    # (row, col) in 0-based indexing
-    row_idx, col_idx = changed_positions[0]
+    # the only changed cell between the two boards is the target (row, col) in 0-based indexing
+    row_idx, col_idx = analysis.move_at(next_turn)
 
     # Build the answer as a string.
     # space-separated "row col" in 0-based indices.
@@ -124,7 +116,7 @@ def _focus_reason_next_move(
 
     return player, color, can_win, can_lose, best_next_move, DatasetRow(
         img_path=str(img_path),
-        img_bytes=img_bytes,
+        img_id=img_id,
 
         family=FAMILY,
         q_id=q_id,
@@ -1,12 +1,13 @@
 import numpy as np
 
+from threat_search import five_moves
 from gen_dataset.dataset_schema import DatasetRow
+from gen_dataset.sphinx.analysis import get_game_analysis
 from gen_dataset.sphinx.core import (
     QuestionFamily,
-    persist_turn_image,
+    submit_turn_image,
     get_question_text
 )
-from src import game_logic
 
 
 def _focus_win_next_turn(
@@ -32,7 +33,8 @@ def _focus_win_next_turn(
     # get last turn and second to last turn
     last_turn = game.shape[0] - 1
     second_to_last_turn = game.shape[0] - 2
-    winner = game_logic.get_winner(game[last_turn], 5)
+    analysis = get_game_analysis(game)
+    winner = analysis.winner
     if winner == 0:
         raise ValueError(
             f"The game did not end. winner={winner}."
@@ -40,37 +42,32 @@ def _focus_win_next_turn(
 
     # get board for second to last turn
     board = game[second_to_last_turn]
-    # Persist the image and get img_bytes
-    img_path, img_bytes = persist_turn_image(board, last_turn, sim_id, non_rand_img=non_rand_img)
+    # Persist the image and get its img_id
+    img_path, img_id = submit_turn_image(board, last_turn, sim_id, non_rand_img=non_rand_img)
 
-    # also get the last board, to compare against
-    board_after = game[last_turn]
-
-    # compare boards to get target (row, col)
-    mask = board != board_after  # shape (15, 15)
-    changed_positions = np.argwhere(mask)  # shape (N, 2)
-    num_changes = changed_positions.shape[0]
-    if num_changes != 1:
-        raise ValueError(
-            f"Expected exactly 1 changed cell, but found {num_changes}. "
-        )
-
-    # (row, col) in 0-based indexing
-    row_idx, col_idx = changed_positions[0]
+    # the only changed cell between this and the last board is the target (row, col) in 0-based indexing
+    row_idx, col_idx = analysis.move_at(last_turn)
 
     # Build the answer as a string.
     # space-separated "row col" in 0-based indices.
     answer = f"{row_idx} {col_idx}"
-    # Different answer formats
+    # Different answer formats of the played move and of every other move that wins right away
+    # (e.g. the other end of an open four)
+    player = 1 if last_turn % 2 == 0 else 2
+    moves = [(row_idx, col_idx)] + [m for m in five_moves(board, player) if m != (row_idx, col_idx)]
     valid_answers = [
-        answer,  # "r c"
-        f"{row_idx},{col_idx}",  # "r,c"
-        f"({row_idx}, {col_idx})"  # "(r, c)"
+        formatted
+        for r, c in moves
+        for formatted in (
+            f"{r} {c}",  # "r c"
+            f"{r},{c}",  # "r,c"
+            f"({r}, {c})"  # "(r, c)"
+        )
     ]
 
     return winner, DatasetRow(
         img_path=str(img_path),
-        img_bytes=img_bytes,
+        img_id=img_id,
 
         family=FAMILY,
         q_id=q_id,
@@ -108,9 +108,8 @@ class ProbabilisticPolicyPlayer(object):
                 else:
                     # probabilistic
                     moves, probabilities = zip(*move_probs)
-                    probabilities = np.array(probabilities)
-                    probabilities **= self.beta
-                    probabilities = probabilities / probabilities.sum()
+                    # same (numerically stable) temperature as in get_move
+                    probabilities = self.apply_temperature(probabilities)
                     choice_idx = np.random.choice(len(moves), p=probabilities)
                     move_list[i] = moves[choice_idx]
         return move_list
@@ -136,3 +135,49 @@ class MCTSPlayer(object):
 
     def do_move(self, move):
         self.mcts.update_with_move(move)
+
+
+# weight of a pattern a stone at an empty position would create, see pattern_value
+_PATTERN_VALUE_WEIGHTS = np.zeros(PATTERN_LINK6 + 1)
+_PATTERN_VALUE_WEIGHTS[[PATTERN_LIVE3, PATTERN_RUSH4, PATTERN_LIVE4]] = [1.0, 2.0, 4.0]
+
+
+def pattern_value(state):
+    """cheap leaf value in [-1, 1] for the current player from state.blank_types, used by
+    BatchedMCTSPlayer in place of a value network:
+    an own five wins, two fives of the opponent can not be blocked, an own live four wins
+    if the opponent has no five to play, otherwise the difference of the weighted patterns.
+    """
+    empty = state.board == EMPTY
+    player = state.current_player
+    mine = state.blank_types[:, :, state.type_idx_for_color(player)][empty]
+    theirs = state.blank_types[:, :, state.type_idx_for_color(-player)][empty]
+
+    if (mine == PATTERN_LINK5).any():
+        return 1.0
+    their_fives = (theirs == PATTERN_LINK5).any(axis=1).sum()
+    if their_fives >= 2:
+        return -1.0
+    if their_fives == 0 and (mine == PATTERN_LIVE4).any():
+        return 1.0
+    score = _PATTERN_VALUE_WEIGHTS[mine].sum() - _PATTERN_VALUE_WEIGHTS[theirs].sum()
+    return float(np.tanh(score / 8))
+
+
+class BatchedMCTSPlayer(object):
+    """A player searching with mcts.BatchedMCTS, the priors of the policy are evaluated
+    batch_size leaves at a time
+    """
+
+    def __init__(self, policy, value_function=pattern_value, c_puct=5, n_playout=800, batch_size=8,
+                 time_limit=None):
+        self.mcts = mcts.BatchedMCTS(policy, value_function, c_puct, n_playout, batch_size, time_limit)
+
+    def get_move(self, state):
+        if len(state.get_legal_moves()) > 0:
+            return self.mcts.get_move(state)
+        # No 'sensible' moves available, so do pass move
+        return PASS_MOVE
+
+    def do_move(self, move):
+        self.mcts.update_with_move(move)
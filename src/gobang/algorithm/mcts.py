@@ -5,9 +5,12 @@ game of Go; everything in this file is implemented generically with respect to s
 policy function, and value function.
 """
 import numpy as np
+from collections import OrderedDict
 from operator import itemgetter
 from time import time
 
+from gobang.game import PATTERN_LINK5
+
 
 class TreeNode(object):
     """A node in the MCTS tree. Each node keeps track of its own value Q, prior probability P, and
@@ -229,3 +232,290 @@ class MCTS(object):
             self._root._parent = None
         else:
             self._root = TreeNode(None, 1.0)
+
+
+class BatchedMCTS(object):
+    """PUCT Monte Carlo Tree Search with the tree stored in preallocated numpy arrays and the leaves
+    evaluated in batches.
+
+    Node i keeps its visit count N[i], its total value W[i] from the perspective of the player who
+    made the move leading to it, its prior P[i], that move action[i] (as x * size + y) and parent[i].
+    The children of an expanded node are one contiguous block of nodes
+    first_child[i]:first_child[i] + num_children[i], so selection is a vectorized PUCT over a slice.
+    Terminal nodes (game over or no legal moves) keep their value in terminal_value[i].
+
+    A node whose player to move can complete five only gets those winning moves as children
+    (known to be terminal), a node where only the opponent can complete five only gets the blocks.
+    Unvisited children are valued with the parent's Q (first play urgency).
+
+    Every iteration descends batch_size times from the root. Each descent adds a virtual loss to the
+    nodes on its path, which steers the following descents of the same iteration to other leaves.
+    The collected leaves are expanded with one policy.batch_eval_state call and valued with value_fn.
+
+    The states of the most recently expanded nodes are kept (up to max_states), so reaching a leaf
+    costs one state copy and one move instead of replaying the whole path from the root.
+    """
+
+    def __init__(self, policy, value_fn, c_puct=5, n_playout=800, batch_size=8, time_limit=None,
+                 capacity=1 << 16, max_nodes=1 << 20, max_states=4096):
+        """Arguments:
+        policy -- object with batch_eval_state(states), e.g. a CNNPolicy, for the priors.
+        value_fn -- a function that takes in a state and outputs a score in [-1, 1] from the
+            current player's perspective.
+        n_playout -- number of leaf evaluations per get_move, None to only use time_limit.
+        batch_size -- number of leaves evaluated together per iteration.
+        time_limit -- seconds per get_move, stops before n_playout playouts if reached.
+        capacity -- initial number of nodes, the arrays double when full.
+        max_nodes -- the tree is discarded at the start of get_move once it has more nodes.
+        max_states -- number of node states kept in memory.
+        """
+        if n_playout is None and time_limit is None:
+            raise ValueError("n_playout and time_limit must not both be None")
+        self._policy = policy
+        self._value = value_fn
+        self._c_puct = c_puct
+        self._n_playout = n_playout
+        self._batch_size = batch_size
+        self.time_limit = time_limit
+        self._max_nodes = max_nodes
+        self._max_states = max_states
+
+        self.N = np.zeros(capacity, dtype=np.int32)
+        self.W = np.zeros(capacity, dtype=np.float64)
+        self.P = np.zeros(capacity, dtype=np.float32)
+        self.VL = np.zeros(capacity, dtype=np.int32)  # virtual losses of the pending descents
+        self.action = np.zeros(capacity, dtype=np.int32)
+        self.parent = np.zeros(capacity, dtype=np.int32)
+        self.first_child = np.zeros(capacity, dtype=np.int32)  # -1: not expanded yet
+        self.num_children = np.zeros(capacity, dtype=np.int32)
+        self.terminal_value = np.zeros(capacity, dtype=np.float32)  # nan: not terminal (or unknown)
+        self._states = OrderedDict()  # node -> state, LRU
+        self._reset_tree(None)
+
+    def _reset_tree(self, state):
+        self._size = 1
+        self._root = 0
+        self._root_history = None
+        self._root_state = state.copy() if state is not None else None
+        self._states.clear()
+        self.N[0] = self.W[0] = self.VL[0] = 0
+        self.parent[0] = -1
+        self.first_child[0] = -1
+        self.num_children[0] = 0
+        self.terminal_value[0] = np.nan
+
+    def _allocate(self, count):
+        """index of a block of count new nodes, growing the arrays if needed"""
+        start = self._size
+        if start + count > len(self.N):
+            capacity = max(2 * len(self.N), start + count)
+            for name in ("N", "W", "P", "VL", "action", "parent", "first_child", "num_children",
+                         "terminal_value"):
+                old = getattr(self, name)
+                new = np.zeros(capacity, dtype=old.dtype)
+                new[:start] = old[:start]
+                setattr(self, name, new)
+        self._size = start + count
+        return start
+
+    def _state_at(self, node):
+        """a copy of the state of the given node, replayed from the nearest ancestor with a kept state"""
+        moves = []
+        while node != self._root and node not in self._states:
+            moves.append(int(self.action[node]))
+            node = int(self.parent[node])
+        if node == self._root:
+            state = self._root_state.copy()
+        else:
+            self._states.move_to_end(node)
+            state = self._states[node].copy()
+        for action in reversed(moves):
+            state.do_move(divmod(action, state.size))
+        return state
+
+    def _keep_state(self, node, state):
+        self._states[node] = state
+        if len(self._states) > self._max_states:
+            self._states.popitem(last=False)
+
+    def _select_child(self, node):
+        start = self.first_child[node]
+        end = start + self.num_children[node]
+        n = self.N[start:end] + self.VL[start:end]
+        # unvisited children get the Q of the parent for the player to move there,
+        # virtual losses count as lost visits
+        parent_q = -self.W[node] / self.N[node] if self.N[node] > 0 else 0.0
+        q = np.where(n > 0, (self.W[start:end] - self.VL[start:end]) / np.maximum(n, 1), parent_q)
+        n_parent = max(1, self.N[node] + self.VL[node])
+        u = self._c_puct * self.P[start:end] * np.sqrt(n_parent) / (1 + n)
+        return start + int(np.argmax(q + u))
+
+    def _descend(self):
+        """walk from the root to a leaf (a terminal or not yet expanded node).
+        Returns the path of nodes (root first) with a virtual loss added to them.
+        """
+        node = self._root
+        path = [node]
+        while self.first_child[node] >= 0 and np.isnan(self.terminal_value[node]):
+            node = self._select_child(node)
+            path.append(node)
+        path = np.array(path, dtype=np.int64)
+        self.VL[path] += 1
+        return path
+
+    def _expand(self, node, action_probs, size):
+        count = len(action_probs)
+        start = self._allocate(count)
+        end = start + count
+        if count:
+            actions, priors = zip(*action_probs)
+            self.action[start:end] = [x * size + y for x, y in actions]
+            self.P[start:end] = priors
+        self.N[start:end] = 0
+        self.W[start:end] = 0
+        self.VL[start:end] = 0
+        self.parent[start:end] = node
+        self.first_child[start:end] = -1
+        self.num_children[start:end] = 0
+        self.terminal_value[start:end] = np.nan
+        self.first_child[node] = start
+        self.num_children[node] = count
+
+    @staticmethod
+    def _forced_moves(state, action_probs):
+        """(action_probs, wins): the moves completing five for the player to move (wins=True) if there are any,
+        otherwise the blocks of the opponent's fives, otherwise all of action_probs.
+        """
+        empty = state.board == 0
+        for color, wins in ((state.current_player, True), (-state.current_player, False)):
+            fives = (state.blank_types[:, :, state.type_idx_for_color(color)] == PATTERN_LINK5).any(axis=-1) & empty
+            if fives.any():
+                forced = [(action, prob) for action, prob in action_probs if fives[action]]
+                if forced:
+                    total = sum(prob for _, prob in forced)
+                    if total > 0:
+                        return [(action, prob / total) for action, prob in forced], wins
+                    return [(action, 1.0 / len(forced)) for action, _ in forced], wins
+        return action_probs, False
+
+    def _backup(self, path, leaf_value):
+        """leaf_value is from the perspective of the player to move at the leaf (path[-1])"""
+        self.VL[path] -= 1
+        self.N[path] += 1
+        # the leaf's W is from the view of the opponent of the player to move there, alternating upwards
+        signs = np.where(np.arange(len(path))[::-1] % 2 == 0, -1.0, 1.0)
+        self.W[path] += signs * leaf_value
+
+    @staticmethod
+    def _terminal_value(state):
+        winner = state.get_winner()
+        if winner == 0:
+            return 0.0
+        return 1.0 if winner == state.current_player else -1.0
+
+    def _run_batch(self):
+        """one iteration: up to batch_size descents, one batched leaf evaluation.
+        Returns the number of playouts done.
+        """
+        leaves = []  # (path, state)
+        pending = set()
+        collided = []  # paths of descents that reached a leaf of this batch again
+        playouts = 0
+        for _ in range(2 * self._batch_size):
+            if playouts + len(leaves) >= self._batch_size:
+                break
+            path = self._descend()
+            leaf = int(path[-1])
+            if not np.isnan(self.terminal_value[leaf]):
+                self._backup(path, self.terminal_value[leaf])
+                playouts += 1
+                continue
+            if leaf in pending:
+                # another descent of this batch already reached this leaf, its virtual loss is kept
+                # until the batch is evaluated, so the next descents are steered away from it
+                collided.append(path)
+                continue
+
+            state = self._state_at(leaf)
+            if state.is_end_of_game:
+                self.terminal_value[leaf] = self._terminal_value(state)
+                self._backup(path, self.terminal_value[leaf])
+                playouts += 1
+            else:
+                pending.add(leaf)
+                leaves.append((path, state))
+
+        if leaves:
+            states = [state for _, state in leaves]
+            all_action_probs = self._policy.batch_eval_state(states)
+            for (path, state), action_probs in zip(leaves, all_action_probs):
+                leaf = int(path[-1])
+                action_probs, wins = self._forced_moves(state, action_probs)
+                self._expand(leaf, action_probs, state.size)
+                if wins:
+                    # lost for the player to move after any of these moves
+                    start = self.first_child[leaf]
+                    self.terminal_value[start:start + self.num_children[leaf]] = -1.0
+                if action_probs:
+                    self._keep_state(leaf, state)
+                    self._backup(path, self._value(state))
+                else:
+                    # no legal moves left
+                    self.terminal_value[leaf] = 0.0
+                    self._backup(path, 0.0)
+            playouts += len(leaves)
+        for path in collided:
+            self.VL[path] -= 1
+        return playouts
+
+    def _sync_root(self, state):
+        """reuse the subtree of the moves played since the last search, otherwise start a new tree"""
+        history = tuple(state.history)
+        old = self._root_history
+        if self._size > self._max_nodes or old is None or history[:len(old)] != old:
+            self._reset_tree(state)
+        else:
+            for x, y in history[len(old):]:
+                node = self._root
+                start, count = self.first_child[node], self.num_children[node]
+                matches = np.flatnonzero(self.action[start:start + count] == x * state.size + y)
+                if start < 0 or len(matches) == 0:
+                    self._reset_tree(state)
+                    break
+                self._root = start + int(matches[0])
+            self._root_state = state.copy()
+        self._root_history = history
+
+    def get_move(self, state):
+        """Runs the playouts in batches and returns the most visited action, None without legal moves."""
+        self._sync_root(state)
+        start_time = time()
+        playouts = 0
+        while self._n_playout is None or playouts < self._n_playout:
+            playouts += self._run_batch()
+            if self.time_limit and time() - start_time >= self.time_limit:
+                break
+
+        start, count = self.first_child[self._root], self.num_children[self._root]
+        if start < 0 or count == 0:
+            return None
+        best = start + int(np.argmax(self.N[start:start + count]))
+        return divmod(int(self.action[best]), state.size)
+
+    def update_with_move(self, last_move):
+        """Advance the root to the child of last_move, the tree is discarded at the next get_move
+        if there is no such child.
+        """
+        if self._root_history is None:
+            return
+        start, count = self.first_child[self._root], self.num_children[self._root]
+        matches = []
+        if last_move is not None and start >= 0:
+            x, y = last_move
+            matches = np.flatnonzero(self.action[start:start + count] == x * self._root_state.size + y)
+        if len(matches) == 0:
+            self._root_history = None
+            return
+        self._root = start + int(matches[0])
+        self._root_state.do_move(last_move)
+        self._root_history = self._root_history + (tuple(last_move),)
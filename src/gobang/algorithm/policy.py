@@ -1,6 +1,11 @@
+import copy
+import warnings
+from collections import OrderedDict, namedtuple
+
 import torch
 import torch.nn as nn
 import numpy as np
+from gobang.game import GameState
 from gobang.preprocessing import Preprocess
 
 
@@ -28,6 +33,12 @@ class CNNPolicy(nn.Module):
         self.cnn3 = nn.Conv2d(hidden_size, hidden_size, kernel_size=3, padding=1)
         self.cnn4 = nn.Conv2d(hidden_size, 1, kernel_size=1)
 
+        # float32 input buffer reused by every evaluation, see _features
+        self._feature_buffer = None
+        # frozen TorchScript module used instead of forward(), see load_inference_model
+        self._inference_module = None
+        self._channels_last = False
+
     def forward(self, features):
         outputs = torch.relu(self.cnn1(features))
         outputs = torch.relu(self.cnn2(outputs))
@@ -49,6 +60,59 @@ class CNNPolicy(nn.Module):
         policy.to(device)
         return policy
 
+    @staticmethod
+    def load_inference_model(pth_file, quantize=False, channels_last=True, num_threads=None, check_parity=False,
+                             parity_states=64):
+        """load the model for cpu inference: traced and frozen with TorchScript,
+        optionally with int8 weights and activations (quantize) and a channels-last memory layout
+
+        With check_parity, the frozen module is checked against the eager model on parity_states
+        sampled positions, see check_inference_parity and INFERENCE_TOLERANCES.
+        The int8 model is calibrated on the same positions.
+        num_threads pins torch's intra-op thread count (None leaves it as is).
+        """
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+
+        policy = CNNPolicy.load_model(pth_file, device="cpu")
+        policy.eval()
+        states = sample_states(parity_states if check_parity or quantize else 1, seed=0)
+        example = torch.from_numpy(policy._features(states).copy())
+
+        # TorchScript and torch.ao.quantization are deprecated upstream but still the fastest cpu path here
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            module = policy._quantized(example) if quantize else copy.deepcopy(policy)
+            if channels_last:
+                module = module.to(memory_format=torch.channels_last)
+                example = example.contiguous(memory_format=torch.channels_last)
+            with torch.no_grad():
+                module = torch.jit.freeze(torch.jit.trace(module.eval(), example[:1], check_trace=False))
+                # the profiling executor optimizes for the shapes of the first calls,
+                # single states are the common case (bots evaluate one move at a time)
+                for _ in range(3):
+                    module(example[:1])
+
+        policy._inference_module = module
+        policy._channels_last = channels_last
+        if check_parity:
+            check_inference_parity(CNNPolicy.load_model(pth_file, device="cpu"), policy, states,
+                                   *INFERENCE_TOLERANCES[quantize])
+        return policy
+
+    def _quantized(self, calibration_input):
+        """static int8 copy of the network (x86 backend), calibrated on calibration_input"""
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        torch.backends.quantized.engine = "x86"
+        # the softmax stays in float32, a quantized softmax is both slower and coarser
+        qconfig_mapping = get_default_qconfig_mapping("x86").set_object_type(torch.softmax, None)
+        prepared = prepare_fx(copy.deepcopy(self).eval(), qconfig_mapping, (calibration_input[:1],))
+        with torch.no_grad():
+            prepared(calibration_input)
+        return convert_fx(prepared)
+
     @staticmethod
     def _select_moves_and_normalize(nn_output, moves, size):
         """helper function to normalize a distribution over the given list of moves
@@ -67,6 +131,30 @@ class CNNPolicy(nn.Module):
             distribution = distribution / total
         return list(zip(moves, distribution))
 
+    def _features(self, states):
+        """float32 features of the given states, shape (len(states), output_dim, size, size),
+        written into a buffer that is reused (and only grown) between calls
+        """
+        n_states, size = len(states), states[0].size
+        shape = (n_states, self.preprocessor.output_dim, size, size)
+        buffer = self._feature_buffer
+        if buffer is None or buffer.shape[0] < n_states or buffer.shape[1:] != shape[1:]:
+            buffer = np.empty(shape, dtype=np.float32)
+            self._feature_buffer = buffer
+        return self.preprocessor.states_to_tensor(states, out=buffer[:n_states])
+
+    def _network_outputs(self, states):
+        """raw network output (softmax over all size * size positions) for every state,
+        shape (len(states), size * size)
+        """
+        with torch.no_grad():
+            tensor = torch.from_numpy(self._features(states)).to(self.device)
+            if self._inference_module is None:
+                return self(tensor).cpu().numpy()
+            if self._channels_last:
+                tensor = tensor.contiguous(memory_format=torch.channels_last)
+            return self._inference_module(tensor).numpy()
+
     def batch_eval_state(self, states, moves_lists=None):
         """Given a list of states, evaluates them all at once to make best use of GPU
         batching capabilities.
@@ -81,11 +169,9 @@ class CNNPolicy(nn.Module):
         state_size = states[0].size
         if not all([st.size == state_size for st in states]):
             raise ValueError("all states must have the same size")
-        # concatenate together all one-hot encoded states along the 'batch' dimension
-        nn_input = np.concatenate([self.preprocessor.state_to_tensor(s) for s in states], axis=0)
         # pass all input through the network at once (backend makes use of
         # batches if len(states) is large)
-        network_output = self.forward(nn_input)
+        network_output = self._network_outputs(states)
         # default move lists to all legal moves
         moves_lists = moves_lists or [st.get_legal_moves() for st in states]
         results = [
@@ -98,10 +184,184 @@ class CNNPolicy(nn.Module):
         if state.is_end_of_game:
             return []
 
-        with torch.no_grad():
-            tensor = torch.from_numpy(self.preprocessor.state_to_tensor(state)).float().to(self.device)
-            # run the tensor through the network
-            network_output = self(tensor)
-            # print(network_output)
-            moves = moves or state.get_legal_moves()
-            return self._select_moves_and_normalize(network_output[0].cpu().numpy(), moves, state.size)
+        network_output = self._network_outputs([state])
+        moves = moves or state.get_legal_moves()
+        return self._select_moves_and_normalize(network_output[0], moves, state.size)
+
+
+# (max absolute difference of a move probability, fraction of identical argmax moves)
+# that load_inference_model accepts, keyed by quantize; int8 can change the greedy move
+INFERENCE_TOLERANCES = {False: (1e-4, 1.0), True: (0.5, 0.8)}
+
+
+def sample_states(num_states, size=15, seed=0, max_stones=60):
+    """positions with 1 to max_stones random stones (black first) around the center,
+    used for calibration and parity checks
+    """
+    rng = np.random.default_rng(seed)
+    center = size // 2
+    # random stones spread around the center like in a game
+    offsets = rng.normal(scale=size / 6, size=(num_states, size * size, 2))
+    states = []
+    for i in range(num_states):
+        board = np.zeros((size, size), dtype=np.int8)
+        positions = dict.fromkeys(map(tuple, np.clip(np.rint(offsets[i] + center), 0, size - 1).astype(int)))
+        num_stones = min(int(rng.integers(1, max_stones + 1)), len(positions))
+        for n, position in enumerate(list(positions)[:num_stones]):
+            board[position] = 1 if n % 2 == 0 else -1
+        states.append(GameState(size, board, False, False))
+    return states
+
+
+def check_inference_parity(reference, candidate, states, atol, min_argmax_agreement):
+    """compare the move distributions of two policies on the given states,
+    raises ValueError outside of the tolerance
+
+    Returns: (max absolute difference, fraction of states with the same argmax move)
+    """
+    expected = np.asarray(reference._network_outputs(states))
+    actual = np.asarray(candidate._network_outputs(states))
+    max_diff = float(np.abs(expected - actual).max())
+    agreement = float((expected.argmax(axis=1) == actual.argmax(axis=1)).mean())
+    if max_diff > atol or agreement < min_argmax_agreement:
+        raise ValueError("inference model differs from the eager model: max difference %g (allowed %g), "
+                         "argmax agreement %.3f (required %.3f)" % (max_diff, atol, agreement, min_argmax_agreement))
+    return max_diff, agreement
+
+
+# the 8 symmetries of the square board (dihedral group D4) as (rotations, transpose)
+D4_TRANSFORMS = [(k, transpose) for transpose in (False, True) for k in range(4)]
+
+PolicyCacheInfo = namedtuple("PolicyCacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+def transform_board(board, transform):
+    """apply one of D4_TRANSFORMS to a (size, size) array indexed [x][y]"""
+    k, transpose = transform
+    return np.rot90(board.T if transpose else board, k)
+
+
+def inverse_transform_board(board, transform):
+    """undo transform_board(board, transform)"""
+    k, transpose = transform
+    board = np.rot90(board, -k)
+    return board.T if transpose else board
+
+
+class CachedPolicy(object):
+    """LRU cache in front of a CNNPolicy with the same eval_state / batch_eval_state interface
+
+    Positions are keyed by their board, the side to move and the rule flags, so a cached
+    position returns exactly what the policy returns for it.
+
+    With symmetric=True the key is the canonical orientation of the board under the 8 symmetries
+    of the square, so a position and its rotations and reflections share one entry: the raw network
+    output is stored in canonical orientation and transformed back to the queried orientation on a hit.
+    This changes the outputs, the network is not exactly equivariant, so a symmetric variant of a
+    cached position gets the transformed distribution of whichever orientation was evaluated first
+    and the moves depend on the contents of the cache.
+    """
+
+    # features that only depend on the stones on the board (and the fields in _key)
+    CACHEABLE_FEATURES = {"board", "ones", "zeros", "blank_types", "black_ban", "legal"}
+
+    def __init__(self, policy, maxsize=20000, symmetric=False):
+        unsupported = [f for f in policy.preprocessor.feature_list if f.lower() not in self.CACHEABLE_FEATURES]
+        if unsupported:
+            raise ValueError("features depend on more than the board: %s" % ", ".join(unsupported))
+        if maxsize < 1:
+            raise ValueError("maxsize must be >= 1, got %d" % maxsize)
+
+        self.policy = policy
+        self.maxsize = maxsize
+        self.symmetric = symmetric
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    def _key(self, state):
+        """(key, transform) with transform_board(state.board, transform) the canonical board"""
+        board = np.ascontiguousarray(state.board, dtype=np.int8)
+        transforms = D4_TRANSFORMS if self.symmetric else D4_TRANSFORMS[:1]
+        board_key, transform = min((transform_board(board, t).tobytes(), t) for t in transforms)
+        # the opening rules (start_banned) depend on the number of stones, which is part of the board
+        key = (board_key, state.size, state.current_player, state.black_banned, state.start_banned)
+        return key, transform
+
+    def _lookup(self, key):
+        output = self._cache.get(key)
+        if output is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._cache.move_to_end(key)
+        return output
+
+    def _store(self, key, output):
+        self._cache[key] = output
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def _network_outputs(self, states):
+        """like CNNPolicy._network_outputs, only the cache misses are passed through the network"""
+        size = states[0].size
+        outputs = [None] * len(states)
+        pending = {}  # key -> indices of the states that miss it
+        keys = []
+        for i, state in enumerate(states):
+            key, transform = self._key(state)
+            keys.append((key, transform))
+            if key in pending:
+                # a symmetric duplicate earlier in this batch is evaluated already
+                self.hits += 1
+                pending[key].append(i)
+                continue
+            canonical = self._lookup(key)
+            if canonical is not None:
+                outputs[i] = inverse_transform_board(canonical, transform).ravel()
+            else:
+                pending.setdefault(key, []).append(i)
+
+        if pending:
+            # one evaluation per distinct position, duplicates within the batch share it
+            first = [indices[0] for indices in pending.values()]
+            network_output = self.policy._network_outputs([states[i] for i in first])
+            for row, (key, indices) in enumerate(pending.items()):
+                output = network_output[row].reshape(size, size)
+                self._store(key, transform_board(output, keys[indices[0]][1]).copy())
+                outputs[indices[0]] = network_output[row]
+                for i in indices[1:]:
+                    outputs[i] = inverse_transform_board(self._cache[key], keys[i][1]).ravel()
+        return outputs
+
+    def batch_eval_state(self, states, moves_lists=None):
+        """cached CNNPolicy.batch_eval_state"""
+        n_states = len(states)
+        if n_states == 0:
+            return []
+        state_size = states[0].size
+        if not all([st.size == state_size for st in states]):
+            raise ValueError("all states must have the same size")
+        network_output = self._network_outputs(states)
+        moves_lists = moves_lists or [st.get_legal_moves() for st in states]
+        return [
+            CNNPolicy._select_moves_and_normalize(network_output[i], moves_lists[i], state_size)
+            for i in range(n_states)
+        ]
+
+    def eval_state(self, state, moves=None):
+        """cached CNNPolicy.eval_state"""
+        if state.is_end_of_game:
+            return []
+
+        network_output = self._network_outputs([state])
+        moves = moves or state.get_legal_moves()
+        return CNNPolicy._select_moves_and_normalize(network_output[0], moves, state.size)
+
+    def cache_info(self):
+        return PolicyCacheInfo(self.hits, self.misses, self.maxsize, len(self._cache))
+
+    def cache_clear(self):
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
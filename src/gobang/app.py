@@ -1,4 +1,6 @@
+import traceback
 from os.path import join, dirname, abspath
+from threading import Thread
 from time import time
 from functools import partial
 from tkinter import *
@@ -46,6 +48,9 @@ class App:
         self.forbidden = []
 
         self.player = None
+        # the ai searches in a worker thread, results of an outdated search (see _search_id) are dropped
+        self._thinking = False
+        self._search_id = 0
         self.player_type = IntVar(value=2)
         self._build_player(2)
 
@@ -93,7 +98,6 @@ class App:
         menu.add_cascade(label='Opponent', menu=opponent_menu)
         for i, p in enumerate(PLAYERS):
             opponent_menu.add_radiobutton(label=p, value=i, variable=self.player_type,
-                                          state=DISABLED if i > 2 else NORMAL,
                                           command=partial(self._build_player, player_type=i))
 
     def _draw_board(self):
@@ -166,6 +170,8 @@ class App:
         return move
 
     def human_play(self, move):
+        if self.player and not self.is_human_turn():
+            return
         if self.state.is_legal(move):
             self._do_play_chess(move)
 
@@ -173,11 +179,30 @@ class App:
                 self.invoke_after(10, self.play_chess_if_needed)
 
     def play_chess_if_needed(self):
-        if not self.state.is_end_of_game and not self.is_human_turn():
-            now = time()
-            move = self.player.get_move(self.state)
+        if self._thinking or self.player is None or self.state.is_end_of_game or self.is_human_turn():
+            return
+        # the search runs off the tk main loop, so the window stays responsive
+        self._thinking = True
+        Thread(target=self._think, args=(self.player, self.state.copy(), self._search_id), daemon=True).start()
+
+    def _think(self, player, state, search_id):
+        now = time()
+        try:
+            move = player.get_move(state)
+        except Exception:
+            traceback.print_exc()
+            move = None
+        self.invoke_after(0, partial(self._on_move_found, search_id, move, time() - now))
+
+    def _on_move_found(self, search_id, move, cost):
+        self._thinking = False
+        if search_id != self._search_id:
+            # the game, the colors or the opponent changed during the search
+            self.play_chess_if_needed()
+            return
+        if move is not None:
             self._do_play_chess(move)
-            print("time cost:{:.3f}, {}".format(time() - now, move))
+            print("time cost:{:.3f}, {}".format(cost, move))
 
     def _do_play_chess(self, move):
         if self.state.is_end_of_game:
@@ -214,6 +239,7 @@ class App:
         return self.state.current_player == self.human
 
     def reset_game(self):
+        self._search_id += 1
         self.state = GameState()
         self._draw_forbidden()
 
@@ -225,6 +251,7 @@ class App:
 
     def switch_black(self):
         self.human = -self.human
+        self._search_id += 1
         self.play_chess_if_needed()
 
     def _build_player(self, player_type):
@@ -235,20 +262,17 @@ class App:
         # "Thinking AI(4s)",
         # "Thinking AI(8s)",
         # "Thinking AI(16s)",
+        self._search_id += 1
         self.policy = CNNPolicy.load_model(join(HOME_DIR, "data", "model.pth"))
         if player_type == 0:
             self.player = None
-        if player_type == 1:
+        elif player_type == 1:
             self.player = GreedyPolicyPlayer(self.policy)
         elif player_type == 2:
             self.player = ProbabilisticPolicyPlayer(self.policy, temperature=0.1)
-        # else:
-        #     self.value = CNNValue.load_model('models/value_model_47p_3331.json')
-        #     self.value.model.load_weights('value_rl_47/weights.00000.hdf5')
-        #
-        #     self.player = MCTSPlayer(self.value.eval_state, self.policy.eval_state,
-        #                              None, lmbda=0, playout_depth=5, rollout_limit=0, n_playout=10,
-        #                              time_limit=2**(player_type - 2))
+        else:
+            # no value network, the leaves are valued by pattern_value
+            self.player = BatchedMCTSPlayer(self.policy, n_playout=None, time_limit=2 ** (player_type - 2))
 
     def on_click(self, event):
         move = self._move_from_coords(event.x, event.y)
@@ -21,6 +21,10 @@ PATTERN_LINK5 = 4  # 五连
 PATTERN_LINK6 = 5  # 长连：形成的5个以上同色棋子不间隔的相连
 
 
+# the 4 line directions (dx, dy), same order as the last axis of GameState.blank_types
+DIRECTIONS = [(1, 0), (0, 1), (1, 1), (1, -1)]
+
+
 class IllegalMove(Exception):
     pass
 
@@ -85,7 +89,14 @@ class GameState(object):
         other.board = self.board.copy()
         other.__current_player = self.__current_player
         other.history = list(self.history)
+        other.is_end_of_game = self.is_end_of_game
+        other.winner = self.winner
+        other.stone_ages = self.stone_ages.copy()
         other.black_banned = self.black_banned
+        other.start_banned = self.start_banned
+        # derived from the board, copied instead of rebuilt
+        other.blank_types = self.blank_types.copy()
+        other.black_banes = self.black_banes.copy()
 
         return other
 
@@ -131,27 +142,42 @@ class GameState(object):
                         else PATTERN_NONE
                     )
 
-    def _stones6_from_board(self, action, color=None):
-        """iterate over four direction, yield 6 continuous stones each time
+    def _window_codes(self, cells, action, color=None):
+        """iterate over four direction, yield the base-3 code (see PATTERN_TABLE)
+        of 6 continuous stones each time
 
+        The 11 cells through action are read once per direction and the code
+        is slid along the line instead of building a list per window.
+
+        :param cells: the board as nested lists (self.board.tolist())
         :param action: (x, y)
         :param color: BLACK, WHITE
-        :return: (direction, stones)
+        :return: (direction, code)
         """
         ox, oy = action
-        for direction, (dx, dy) in enumerate(
-            [(1, 0), (0, 1), (1, 1), (1, -1)]
-        ):  # 4 directions
-            for i in range(5, -1, -1):
-                x, y = ox - dx * i, oy - dy * i
-                if not self._on_board((x, y)) or not self._on_board(
-                    (x + dx * 5, y + dy * 5)
-                ):
-                    continue
-                stones6 = [self.board[x + dx * j][y + dy * j] for j in range(6)]
-                if color is not None:
-                    stones6[i - 6] = color
-                yield direction, stones6
+        size = self.size
+        for direction, (dx, dy) in enumerate(DIRECTIONS):
+            digits = []
+            center = 0
+            for j in range(-5, 6):
+                x, y = ox + dx * j, oy + dy * j
+                if 0 <= x < size and 0 <= y < size:
+                    if j == 0:
+                        center = len(digits)
+                    digits.append(cells[x][y] % 3)
+            if color is not None:
+                digits[center] = color % 3
+
+            num_windows = len(digits) - 5
+            if num_windows <= 0:
+                continue
+            code = 0
+            for j in range(5, -1, -1):
+                code = code * 3 + digits[j]
+            yield direction, code
+            for k in range(1, num_windows):
+                code = code // 3 + digits[k + 5] * 243
+                yield direction, code
 
     def is_positional_black_banned(self, action):
         """Find all actions that the current_player has done in the past, taking into
@@ -161,15 +187,16 @@ class GameState(object):
         """
         return self.__current_player != WHITE and self.black_banes[action]
 
-    def _update_banes_for_pos(self, pos):
-        types = self.blank_types[pos][self.type_idx_for_color(BLACK)]
-        if (types == PATTERN_LINK5).any():
+    def _update_banes_for_pos(self, pos, types=None):
+        if types is None:
+            types = self.blank_types[pos][self.type_idx_for_color(BLACK)].tolist()
+        if PATTERN_LINK5 in types:
             self.black_banes[pos] = 0
             return
 
-        c3 = (types == PATTERN_LIVE3).sum()
-        c4 = (types == PATTERN_RUSH4).sum() + (types == PATTERN_LIVE4).sum()
-        c6 = (types == PATTERN_LINK6).sum()
+        c3 = types.count(PATTERN_LIVE3)
+        c4 = types.count(PATTERN_RUSH4) + types.count(PATTERN_LIVE4)
+        c6 = types.count(PATTERN_LINK6)
 
         self.black_banes[pos] = c3 > 1 or c4 > 1 or c6 > 0
 
@@ -177,37 +204,80 @@ class GameState(object):
     def type_idx_for_color(color):
         return 0 if color == BLACK else 1
 
-    def _update_types_for_pos(self, pos):
-        for color in [BLACK, WHITE]:
-            types = self.blank_types[pos][self.type_idx_for_color(color)]
-            types.fill(0)
-
-            for direction, stones6 in self._stones6_from_board(pos, color=color):
-                types[direction] = max(types[direction], self._pattern(stones6, color))
+    def _update_types_for_pos(self, pos, cells=None):
+        if cells is None:
+            cells = self.board.tolist()
 
-        self._update_banes_for_pos(pos)
+        black_types = None
+        for color in [BLACK, WHITE]:
+            table = PATTERN_TABLE[color]
+            types = [PATTERN_NONE] * 4
+            for direction, code in self._window_codes(cells, pos, color=color):
+                pattern = table[code]
+                if pattern > types[direction]:
+                    types[direction] = pattern
+            self.blank_types[pos][self.type_idx_for_color(color)] = types
+            if color == BLACK:
+                black_types = types
+
+        self._update_banes_for_pos(pos, black_types)
 
     def _update_types_for_move(self, action):
         """invoked when the do_move method is invoked"""
         ox, oy = action
         self.blank_types[action].fill(PATTERN_NONE)
 
-        directions = [(1, 0), (0, 1), (1, 1), (1, -1)]
-        for idx, (dx, dy) in enumerate(directions):
+        cells = self.board.tolist()
+        for idx, (dx, dy) in enumerate(DIRECTIONS):
             for i in range(-5, 6):
                 pos = ox - dx * i, oy - dy * i
-                if not self._on_board(pos) or self.board[pos] != EMPTY:
+                if not self._on_board(pos) or cells[pos[0]][pos[1]] != EMPTY:
                     continue
-                self._update_types_for_pos(pos)
+                self._update_types_for_pos(pos, cells)
 
     def _update_types_for_all(self):
-        """invoked when reset all board"""
-        self.blank_types.fill(PATTERN_NONE)
+        """invoked when reset all board
 
-        for x in range(self.size):
-            for y in range(self.size):
-                if self.board[x][y] == EMPTY:
-                    self._update_types_for_pos((x, y))
+        Vectorized version of calling _update_types_for_pos for every empty position:
+        the codes of all 6-cell windows of a direction are computed at once,
+        every empty position then takes the max pattern over the (up to 6)
+        windows containing it, with its own cell set to the color.
+        """
+        size = self.size
+        digits = np.pad(np.asarray(self.board, dtype=np.int64) % 3, 5)
+        on_board = np.pad(np.ones((size, size), dtype=bool), 5)
+        empty = np.asarray(self.board) == EMPTY
+
+        # window starts cover the board plus a margin of 5, so that every window
+        # containing a board position can be looked up by a plain shift
+        span = size + 10
+        self.blank_types.fill(PATTERN_NONE)
+        for direction, (dx, dy) in enumerate(DIRECTIONS):
+            codes = np.zeros((span, span), dtype=np.int64)
+            valid = np.ones((span, span), dtype=bool)
+            for j in range(6):
+                shifted = _shift(digits, dx * j, dy * j)
+                codes += shifted * 3 ** j
+                valid &= _shift(on_board, dx * j, dy * j)
+
+            for color in (BLACK, WHITE):
+                table = PATTERN_ARRAY[color]
+                types = np.zeros((size, size), dtype=self.blank_types.dtype)
+                for j in range(6):
+                    # windows starting j cells before the position, its own cell is digit j
+                    start_codes = _shift(codes, -dx * j, -dy * j)[5:5 + size, 5:5 + size]
+                    start_valid = _shift(valid, -dx * j, -dy * j)[5:5 + size, 5:5 + size] & empty
+                    idx = np.where(start_valid, start_codes + (color % 3) * 3 ** j, 0)
+                    np.maximum(types, table[idx], out=types)
+                self.blank_types[:, :, self.type_idx_for_color(color), direction] = np.where(empty, types, 0)
+
+        types = self.blank_types[:, :, self.type_idx_for_color(BLACK), :]
+        link5 = (types == PATTERN_LINK5).any(axis=-1)
+        c3 = (types == PATTERN_LIVE3).sum(axis=-1)
+        c4 = ((types == PATTERN_RUSH4) | (types == PATTERN_LIVE4)).sum(axis=-1)
+        c6 = (types == PATTERN_LINK6).sum(axis=-1)
+        banes = ~link5 & ((c3 > 1) | (c4 > 1) | (c6 > 0))
+        self.black_banes[empty] = banes[empty]
 
     def _is_init_rules_accept(self, action):
         if not self.start_banned:
@@ -257,10 +327,11 @@ class GameState(object):
                 print("Draw")
             return True
 
-        color = self.board[action]
+        color = int(self.board[action])
 
-        for direction, stones6 in self._stones6_from_board(action, color=None):
-            if self._pattern(stones6, color) == PATTERN_LINK5:
+        table = PATTERN_TABLE[color]
+        for direction, code in self._window_codes(self.board.tolist(), action, color=None):
+            if table[code] == PATTERN_LINK5:
                 self.is_end_of_game = True
                 self.winner = color
                 if verbose:
@@ -306,3 +377,30 @@ class GameState(object):
         if len(self.history) >= 9:
             self._check_is_game_over(action, verbose)
         return self.is_end_of_game
+
+
+def _build_pattern_table(color):
+    """GameState._pattern for every 6-cell window, indexed by its base-3 code
+    sum(digit_j * 3 ** j) with digit = stone % 3 (EMPTY -> 0, BLACK -> 1, WHITE -> 2)
+    """
+    table = []
+    for code in range(3 ** 6):
+        stones6 = []
+        for _ in range(6):
+            code, digit = divmod(code, 3)
+            stones6.append({0: EMPTY, 1: BLACK, 2: WHITE}[digit])
+        table.append(GameState._pattern(stones6, color))
+    return table
+
+
+PATTERN_TABLE = {color: _build_pattern_table(color) for color in (BLACK, WHITE)}
+PATTERN_ARRAY = {color: np.array(table, dtype=np.int32) for color, table in PATTERN_TABLE.items()}
+
+
+def _shift(a, dx, dy):
+    """out[x, y] = a[x + dx, y + dy] (zero / False outside of a)"""
+    out = np.zeros_like(a)
+    h, w = a.shape
+    out[max(0, -dx):min(h, h - dx), max(0, -dy):min(w, w - dy)] = \
+        a[max(0, dx):min(h, h + dx), max(0, dy):min(w, w + dy)]
+    return out
@@ -1,98 +1,131 @@
 from gobang.game import *
 
 
-def get_board(state):
+# every feature has a fill function writing its planes into a preallocated
+# (size_of_feature, board_size, board_size) slice of the float32 input buffer,
+# indexed (plane, x, y) like the tensors of Preprocess.state_to_tensor
+
+def fill_board(state, out):
     """A feature encoding WHITE BLACK and EMPTY on separate planes, but plane 0
     always refers to the current player and plane 1 to the opponent
     """
-    planes = np.zeros((state.size, state.size, 3))
-    planes[:, :, 0] = state.board == state.current_player  # own stone
-    planes[:, :, 1] = state.board == -state.current_player  # opponent stone
-    planes[:, :, 2] = state.board == EMPTY  # empty space
-    return planes
+    board = state.board
+    np.equal(board, state.current_player, out=out[0], casting="unsafe")  # own stone
+    np.equal(board, -state.current_player, out=out[1], casting="unsafe")  # opponent stone
+    np.equal(board, EMPTY, out=out[2], casting="unsafe")  # empty space
 
 
-def get_blank_types(state, maximum=5):
-    """
+def fill_ones(state, out):
+    out.fill(1)
+
+
+def fill_zeros(state, out):
+    out.fill(0)
+
+
+def fill_blank_types(state, out, maximum=5):
+    """one-hot of state.blank_types, plane (idx * nums_line + line) * maximum + blank_type - 1
+    where idx 0 is the current player and idx 1 the opponent
     """
     nums_line = 4
-    nums_color = 2
-    planes = np.zeros((state.size, state.size, maximum * nums_line * nums_color))
-
     current_color = state.current_player
-    for idx, color in enumerate([current_color, -current_color]):
-        color_idx = state.type_idx_for_color(color)
-        for x in range(state.size):
-            for y in range(state.size):
-                for line in range(nums_line):
-                    blank_type = state.blank_types[x][y][color_idx][line]
-                    assert 0 <= blank_type <= maximum
-                    if blank_type > 0:
-                        planes[x, y, (idx * nums_line + line) * maximum + blank_type - 1] = 1
-    return planes
-
-
-def get_black_banes(state):
-    planes = np.zeros((state.size, state.size, 2))
+    color_idxs = [state.type_idx_for_color(current_color), state.type_idx_for_color(-current_color)]
+
+    # (size, size, 2, nums_line) -> (2 * nums_line, size, size)
+    blank_types = state.blank_types[:, :, color_idxs, :].reshape(state.size, state.size, 2 * nums_line)
+    blank_types = blank_types.transpose(2, 0, 1)
+    assert blank_types.min() >= 0 and blank_types.max() <= maximum
+
+    one_hot = out.reshape(2 * nums_line, maximum, state.size, state.size)
+    np.equal(
+        blank_types[:, np.newaxis], np.arange(1, maximum + 1)[np.newaxis, :, np.newaxis, np.newaxis],
+        out=one_hot, casting="unsafe",
+    )
+
+
+def fill_black_banes(state, out):
+    out.fill(0)
     if state.black_banned:
         ban_idx = 0 if state.current_player == BLACK else 1
-        planes[state.black_banes, ban_idx] = 1
-    return planes
+        out[ban_idx][state.black_banes] = 1
 
 
-def get_turns_since(state, maximum=8):
+def fill_turns_since(state, out, maximum=8):
     """A feature encoding the age of the stone at each location up to 'maximum'
 
     Note:
     - the [maximum-1] plane is used for any stone with age greater than or equal to maximum
     - EMPTY locations are all-zero features
     """
-    planes = np.zeros((state.size, state.size, maximum))
-    for x in range(state.size):
-        for y in range(state.size):
-            if state.stone_ages[x][y] >= 0:
-                planes[x, y, min(state.stone_ages[x][y], maximum - 1)] = 1
-    return planes
+    out.fill(0)
+    ages = state.stone_ages
+    xs, ys = np.nonzero(ages >= 0)
+    out[np.minimum(ages[xs, ys], maximum - 1), xs, ys] = 1
 
 
-def get_legal(state):
+def fill_legal(state, out):
     """Zero at all illegal moves, one at all legal moves. Unlike sensibleness, no eye check is done
     """
-    feature = np.zeros((state.size, state.size, 1))
-    for (x, y) in state.get_legal_moves():
-        feature[x, y, 0] = 1
+    out.fill(0)
+    moves = state.get_legal_moves()
+    if moves:
+        xs, ys = zip(*moves)
+        out[0, list(xs), list(ys)] = 1
+
+
+def _planes(fill, size_of_feature):
+    """wraps a fill function into the old-style feature function returning (size, size, size_of_feature)"""
+    def feature(state):
+        out = np.zeros((size_of_feature, state.size, state.size))
+        fill(state, out)
+        # the fill functions write (plane, x, y), the old-style planes are (x, y, plane)
+        return out.transpose(1, 2, 0)
     return feature
 
 
+get_board = _planes(fill_board, 3)
+get_blank_types = _planes(fill_blank_types, 40)
+get_black_banes = _planes(fill_black_banes, 2)
+get_turns_since = _planes(fill_turns_since, 8)
+get_legal = _planes(fill_legal, 1)
+
+
 # named features and their sizes are defined here
 FEATURES = {
     "board": {
         "size": 3,
-        "function": get_board
+        "function": get_board,
+        "fill": fill_board,
     },
     "ones": {
         "size": 1,
-        "function": lambda state: np.ones((state.size, state.size, 1))
+        "function": lambda state: np.ones((state.size, state.size, 1)),
+        "fill": fill_ones,
     },
     "blank_types": {
         "size": 40,
-        "function": get_blank_types
+        "function": get_blank_types,
+        "fill": fill_blank_types,
     },
     "black_ban": {
         "size": 2,
-        "function": get_black_banes
+        "function": get_black_banes,
+        "fill": fill_black_banes,
     },
     "turns_since": {
         "size": 8,
-        "function": get_turns_since
+        "function": get_turns_since,
+        "fill": fill_turns_since,
     },
     "zeros": {
         "size": 1,
-        "function": lambda state: np.zeros((state.size, state.size, 1))
+        "function": lambda state: np.zeros((state.size, state.size, 1)),
+        "fill": fill_zeros,
     },
     "legal": {
         "size": 1,
-        "function": get_legal
+        "function": get_legal,
+        "fill": fill_legal,
     }
 }
 
@@ -114,17 +147,39 @@ class Preprocess(object):
         self.output_dim = 0
         self.feature_list = feature_list
         self.processors = []
+        self.fillers = []  # (fill function, first plane, last plane + 1)
         for i, feat in enumerate(feature_list):
             feat_ = feat.lower()
             if feat_ in FEATURES:
                 self.processors.append(FEATURES[feat_]["function"])
+                start = self.output_dim
                 self.output_dim += FEATURES[feat_]["size"]
+                self.fillers.append((FEATURES[feat_]["fill"], start, self.output_dim))
             else:
                 raise ValueError("unknown feature: %s" % feat)
 
-    def state_to_tensor(self, state):
-        feat_list = [proc(state) for proc in self.processors]
-        # concatenate along feature dimension then add in a singleton 'batch' dimension
-        # f, s = self.output_dim, state.size
-        feat_tensors = np.concatenate(feat_list, axis=-1)
-        return feat_tensors.transpose((2, 0, 1))[np.newaxis, :]
+    def _fill(self, state, out):
+        for fill, start, end in self.fillers:
+            fill(state, out[start:end])
+
+    def state_to_tensor(self, state, out=None):
+        """returns the float32 features of state, shape (1, output_dim, size, size)
+
+        :param out: optional preallocated float32 buffer of that shape to write into
+        """
+        if out is None:
+            out = np.empty((1, self.output_dim, state.size, state.size), dtype=np.float32)
+        self._fill(state, out[0])
+        return out
+
+    def states_to_tensor(self, states, out=None):
+        """batched state_to_tensor, shape (len(states), output_dim, size, size)
+
+        :param out: optional preallocated float32 buffer of that shape to write into
+        """
+        size = states[0].size
+        if out is None:
+            out = np.empty((len(states), self.output_dim, size, size), dtype=np.float32)
+        for i, state in enumerate(states):
+            self._fill(state, out[i])
+        return out
@@ -83,3 +83,159 @@ def render(
     for i, j in indices:
         img = render_single(img, i, j, pieces[points[i, j] - 1], calc_coords)
     return img
+
+
+def _div255(values: npt.NDArray[np.uint32]) -> npt.NDArray[np.uint32]:
+    """
+    Integer division by 255 with rounding, exactly as PIL does it when pasting with a mask.
+    """
+    tmp = values + 128
+    return ((tmp >> 8) + tmp) >> 8
+
+
+class ArrayRenderer:
+    """
+    Renders boards with NumPy instead of one PIL paste per stone.
+    The output is pixel-identical to render().
+
+    The background, the stone sprites and the pixel offsets of every intersection
+    are prepared once. On a regular grid where no two sprites overlap, every
+    intersection is blended with both stones up front in one vectorized alpha blend,
+    so rendering a board is a single masked copy per stone color.
+    """
+
+    def __init__(
+        self,
+        img: Image.Image,
+        pieces: list[Image.Image],
+        size: int,
+        calc_coords: CalcCoordsFn = calc_coords_gomoku,
+    ):
+        self.background = np.array(img.convert("RGB"), dtype=np.uint8)
+        self.size = size
+
+        # top left pixel (y, x) of the sprite for every intersection
+        self.offsets = np.zeros((size, size, 2), dtype=np.intp)
+        sprite_size = None
+        for i in range(size):
+            for j in range(size):
+                x, y, w, h, x_a, y_a = calc_coords(i, j)
+                x, y = adjust_xy(x, y, w, h, Anchor.from_string(x_a), Anchor.from_string(y_a))
+                if sprite_size is not None and sprite_size != (w, h):
+                    raise ValueError("ArrayRenderer requires the same piece size for every intersection")
+                sprite_size = (w, h)
+                self.offsets[i, j] = (y, x)
+
+        w, h = sprite_size
+        self.sprites: list[tuple[npt.NDArray[np.uint32], npt.NDArray[np.uint32]]] = []
+        for piece in pieces:
+            piece = piece.resize((w, h), Image.Resampling.LANCZOS) if piece.size != (w, h) else piece
+            rgba = np.asarray(piece.convert("RGBA"), dtype=np.uint32)
+            self.sprites.append((rgba[:, :, :3], rgba[:, :, 3:]))
+
+        # pixel grid of one sprite, relative to its top left corner
+        self._dy = np.arange(h)[None, :, None]
+        self._dx = np.arange(w)[None, None, :]
+
+        # blended patches[piece] of shape (size, size, h, w, 3), only for the fast path
+        self._patches: list[npt.NDArray[np.uint8]] | None = None
+        if self._is_regular_grid(w, h):
+            cells = self._cells(self.background)
+            self._patches = [
+                _div255(cells.astype(np.uint32) * (255 - alpha) + rgb * alpha).astype(np.uint8)
+                for rgb, alpha in self.sprites
+            ]
+
+    def _is_regular_grid(self, w: int, h: int) -> bool:
+        """
+        True if the sprites lie on an evenly spaced grid inside the image and do not overlap.
+        """
+        y0, x0 = self.offsets[0, 0]
+        step_y = self.offsets[1, 0, 0] - y0 if self.size > 1 else h
+        step_x = self.offsets[0, 1, 1] - x0 if self.size > 1 else w
+        idx = np.arange(self.size)
+        expected = np.stack(np.broadcast_arrays(y0 + idx[:, None] * step_y, x0 + idx[None, :] * step_x), axis=-1)
+
+        img_h, img_w = self.background.shape[:2]
+        return bool(
+            np.array_equal(self.offsets, expected)
+            and step_y >= h
+            and step_x >= w
+            and y0 >= 0
+            and x0 >= 0
+            and self.offsets[-1, -1, 0] + h <= img_h
+            and self.offsets[-1, -1, 1] + w <= img_w
+        )
+
+    def _cells(self, out: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
+        """
+        Writable view of shape (size, size, h, w, 3) on the sprite area of every intersection.
+        Only valid if _is_regular_grid().
+        """
+        rgb, _ = self.sprites[0]
+        h, w = rgb.shape[:2]
+        y0, x0 = self.offsets[0, 0]
+        step_y = self.offsets[1, 0, 0] - y0 if self.size > 1 else h
+        step_x = self.offsets[0, 1, 1] - x0 if self.size > 1 else w
+        row, col, channel = out.strides
+        return np.lib.stride_tricks.as_strided(
+            out[y0:, x0:],
+            shape=(self.size, self.size, h, w, 3),
+            strides=(step_y * row, step_x * col, row, col, channel),
+        )
+
+    def _blend(
+        self,
+        out: npt.NDArray[np.uint8],
+        indices: npt.NDArray[np.intp],
+        piece: int,
+    ) -> None:
+        """
+        Alpha blend the sprite into out at the given intersections (fallback path).
+        """
+        rgb, alpha = self.sprites[piece]
+        img_h, img_w = out.shape[:2]
+
+        top_left = self.offsets[indices[:, 0], indices[:, 1]]
+        ys, xs = np.broadcast_arrays(
+            top_left[:, 0, None, None] + self._dy,
+            top_left[:, 1, None, None] + self._dx,
+        )
+
+        # like PIL, clip sprites that reach over the border of the image
+        k = np.nonzero((ys >= 0) & (ys < img_h) & (xs >= 0) & (xs < img_w))
+        dst = out[ys[k], xs[k]].astype(np.uint32)
+        a = alpha[k[1], k[2]]
+        out[ys[k], xs[k]] = _div255(dst * (255 - a) + rgb[k[1], k[2]] * a)
+
+    def render(
+        self,
+        points: npt.NDArray[np.int8],
+        old_points: npt.NDArray[np.int8] | None = None,
+        img: Image.Image | None = None,
+    ) -> Image.Image:
+        """
+        Same as render(), but on a copy of the background (or of img, if provided).
+        """
+        assert points.shape == (self.size, self.size), f"Expected {(self.size, self.size)} array, got {points.shape}"
+        assert points.dtype == np.int8, f"Expected int8 array, got {points.dtype}"
+        if old_points is not None:
+            assert old_points.shape == points.shape, f"{old_points.shape} != {points.shape}"
+            assert points.dtype == old_points.dtype, f"{points.dtype} != {old_points.dtype}"
+            changed = (points != old_points) & (points != 0)
+        else:
+            changed = points != 0
+
+        if img is None and self._patches is not None:
+            out = self.background.copy()
+            cells = self._cells(out)
+            for piece, patches in enumerate(self._patches):
+                mask = changed & (points == piece + 1)
+                cells[mask] = patches[mask]
+            return Image.fromarray(out, "RGB")
+
+        out = self.background.copy() if img is None else np.array(img.convert("RGB"), dtype=np.uint8)
+        # later stones are drawn over earlier ones, keep the row-major order of render()
+        for i, j in np.argwhere(changed):
+            self._blend(out, np.array([[i, j]]), points[i, j] - 1)
+        return Image.fromarray(out, "RGB")
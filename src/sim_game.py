@@ -1,16 +1,19 @@
 import math
 import random
-from typing import Callable
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Iterator
 
 import numpy as np
 from PIL import Image
 
-from game_logic import create_board, get_winner, make_move
+from game_logic import GameTracker, create_board
 from gomoku_renderer import calc_coords_gomoku, create_gomoku_board, create_pieces
-from renderer import render
+from renderer import ArrayRenderer
 from src.bots.ai_bot import generate_next_move_greedy
 
 Func = Callable[[np.ndarray], tuple[int, int]]
+BatchFunc = Callable[[list[np.ndarray]], list[tuple[int, int]]]
 
 
 def get_func(f: Func | tuple[Func, Func], index: int = 0) -> Func:
@@ -29,16 +32,17 @@ def simulate_game(
     Returns a 3D array of shape (num_moves, size, size) representing the board after each move.
     """
     board = create_board(size)
+    tracker = GameTracker(board, n)
     game_states = []
     current_player = 1
     while True:
         y, x = get_func(function, ((current_player) - 1 % 2))(board)
-        make_move(board, y, x, current_player)
+        # only checks the lines through (y, x), not the whole board
+        winner = tracker.make_move(y, x, current_player)
         # print(f"Player {current_player} placed at (y={y}, x={x})")
 
         game_states.append(board.copy())
 
-        winner = get_winner(board, n)
         if winner != 0:
             # if winner == -1:
             #     print("Game ended in a draw.")
@@ -51,6 +55,90 @@ def simulate_game(
     return np.stack(game_states)
 
 
+@dataclass
+class _LockstepGame:
+    board: np.ndarray
+    tracker: GameTracker
+    game_states: list[np.ndarray] = field(default_factory=list)
+    current_player: int = 1
+    winner: int = 0
+
+
+def simulate_games_batched(
+    function: BatchFunc | tuple[BatchFunc, BatchFunc],
+    num_games: int,
+    batch_size: int = 16,
+    size: int = 15,
+    n: int = 5,
+) -> Iterator[np.ndarray]:
+    """
+    Play num_games games, advancing up to batch_size of them in lockstep,
+    so the bots can evaluate all boards of one step at once (e.g. one forward pass of the policy).
+    The function(s) map a list of boards to one (y, x) move per board.
+
+    Finished games are yielded as soon as they end (in the same format as simulate_game)
+    and replaced by a new game, until num_games games were started.
+    """
+    started = 0
+
+    def start_game(block: bool) -> bool:
+        nonlocal started
+        if started >= num_games:
+            return False
+        started += 1
+        return True
+
+    return simulate_game_stream(function, start_game, batch_size, size, n)
+
+
+def simulate_game_stream(
+    function: BatchFunc | tuple[BatchFunc, BatchFunc],
+    start_game: Callable[[bool], bool],
+    batch_size: int = 16,
+    size: int = 15,
+    n: int = 5,
+) -> Iterator[np.ndarray]:
+    """
+    Like simulate_games_batched, but the number of games is decided on the fly:
+    before every step, start_game(block) is called for every free slot of the batch
+    and a new game is started if it returns True. block is True if no game is running,
+    i.e. start_game may wait for more work. The stream ends once no game is running
+    and start_game(True) returns False.
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be >= 1, got {batch_size}")
+
+    def new_game() -> _LockstepGame:
+        board = create_board(size)
+        return _LockstepGame(board=board, tracker=GameTracker(board, n))
+
+    active: list[_LockstepGame] = []
+    while True:
+        while len(active) < batch_size and start_game(not active):
+            active.append(new_game())
+        if not active:
+            return
+
+        # each player may use a different function, so the batch is split by the player to move
+        to_move = {player: [g for g in active if g.current_player == player] for player in (1, 2)}
+        for player, games in to_move.items():
+            if not games:
+                continue
+            moves = get_func(function, player - 1)([g.board for g in games])
+            for g, (y, x) in zip(games, moves):
+                g.winner = g.tracker.make_move(y, x, player)
+                g.game_states.append(g.board.copy())
+                g.current_player = (player % 2) + 1
+
+        still_active = []
+        for g in active:
+            if g.winner == 0:
+                still_active.append(g)
+            else:
+                yield np.stack(g.game_states)
+        active = still_active
+
+
 def _generate_distinct_colors():
     return [
         (230, 72, 72),
@@ -84,29 +172,51 @@ def _contrasting_line_color(board_color: tuple[int, int, int]):
     return (0, 0, 0) if luminance > 140 else (240, 240, 240)
 
 
-def render_game_step(
-    state: np.ndarray,
-    lcolor: tuple[int, int, int] = (0, 0, 0),
-    color: tuple[int, int, int] = (238, 178, 73),
-    rotate_deg: int | None = None,
-) -> Image.Image:
-    size = 68
+@lru_cache(maxsize=32)
+def _board_renderer(
+    color: tuple[int, int, int],
+    lcolor: tuple[int, int, int],
+    cell_size: int,
+) -> ArrayRenderer:
+    """
+    Empty board (grid lines, star points and labels) and stone sprites, prepared
+    once per (board color, line color, cell size).
+    """
     board_img = create_gomoku_board(
         size=15,  # fields
-        cell_size=size,  # pixel for cell
-        margin=size // 2 + 20,  # margin on all sides in px
+        cell_size=cell_size,  # pixel for cell
+        margin=cell_size // 2 + 20,  # margin on all sides in px
         line_width=2,  # line width
         color=color,  # board color
         line_color=lcolor,  # line color
     )
-    pieces = create_pieces(size)  # 40 cell size in px
+    pieces = _stone_sprites(cell_size)
 
     def calc_coords_gomoku_wrapper(i: int, j: int):
         return calc_coords_gomoku(
-            i, j, size, (size // 2 + 20, size // 2 + 20)
+            i, j, cell_size, (cell_size // 2 + 20, cell_size // 2 + 20)
         )  # 40 cell size in px, (20, 20) margin in px
 
-    img = render(board_img, pieces, state, calc_coords=calc_coords_gomoku_wrapper)
+    return ArrayRenderer(board_img, pieces, 15, calc_coords=calc_coords_gomoku_wrapper)
+
+
+@lru_cache(maxsize=8)
+def _stone_sprites(cell_size: int) -> list[Image.Image]:
+    """
+    Black and white stone sprites, rendered once per cell size.
+    """
+    return create_pieces(cell_size)
+
+
+def render_game_step(
+    state: np.ndarray,
+    lcolor: tuple[int, int, int] = (0, 0, 0),
+    color: tuple[int, int, int] = (238, 178, 73),
+    rotate_deg: int | None = None,
+) -> Image.Image:
+    size = 68
+    # all stones of one color are blended at once, see renderer.ArrayRenderer
+    img = _board_renderer(tuple(color), tuple(lcolor), size).render(state)
     w, h = img.size
     if rotate_deg is not None and rotate_deg != 0:
         img = img.rotate(
@@ -119,21 +229,24 @@ def render_game_step(
     return img
 
 
-def render_game_step_rand(state: np.ndarray, non_rand: bool = False) -> Image.Image:
-    if non_rand:
-        return render_game_step(state=state)
+def random_render_params() -> dict:
+    """
+    Draws the random alterations (board/line color and rotation) used by render_game_step_rand,
+    as keyword arguments for render_game_step.
+    """
     palette = _generate_distinct_colors()
     board_color = random.choice(palette)
     line_color = _contrasting_line_color(board_color)
 
     rotate_deg = random.randint(-30, 30)
 
-    return render_game_step(
-        state=state,
-        lcolor=line_color,
-        color=board_color,
-        rotate_deg=rotate_deg,
-    )
+    return dict(lcolor=line_color, color=board_color, rotate_deg=rotate_deg)
+
+
+def render_game_step_rand(state: np.ndarray, non_rand: bool = False) -> Image.Image:
+    if non_rand:
+        return render_game_step(state=state)
+    return render_game_step(state=state, **random_render_params())
 
 
 if __name__ == "__main__":
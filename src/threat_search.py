@@ -0,0 +1,277 @@
+"""
+Threat-space search: proves or refutes forced wins by continuous fours (VCF)
+or continuous fours and threes (VCT) for the player to move.
+
+Boards are the usual (y, x) int8 boards with 1 = black, 2 = white, five or more in a row wins.
+
+The attacker only plays threats, so the defender's replies are limited to the moves that stop them:
+- after a four (one cell completes five) the block is forced,
+- after a three (some move would create two cells that complete five) the defender may play any of
+  those moves, any of the cells they would complete, or a four of its own.
+Any other reply loses to the open four, so proving the win over this set of replies is sound.
+
+A refutation only means there is no forced win by these threats within max_moves,
+the position may still be won by quieter moves.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import numpy.typing as npt
+
+from utils.bot_utils import board_key, board_window_cells, board_windows, zobrist_table
+
+# root results of solve_vcf / solve_vct, keyed by board hash and search parameters
+_result_cache: OrderedDict[tuple, "ThreatResult"] = OrderedDict()
+_RESULT_CACHE_SIZE = 4096
+
+
+@dataclass(frozen=True)
+class ThreatResult:
+    win: bool | None  # None: node_limit reached before a proof or refutation
+    move: tuple[int, int] | None  # first move of the forced win
+    moves: int | None  # number of own moves of the shortest forced win found, including the five
+    nodes: int
+
+
+class _NodeLimitReached(Exception):
+    pass
+
+
+class _ThreatSearch:
+    """
+    Counts the stones of both players in every window of 5 cells and keeps, per player and count,
+    the windows without opponent stones ("open" windows). A window open for player p with k stones
+    turns into a five with 5 - k more moves, so:
+    - k = 4: its empty cell completes five,
+    - k = 3: its empty cells make a four,
+    - k = 2: its empty cells make a three (if they create a move with two five cells).
+    """
+
+    def __init__(self, board: npt.NDArray[np.int8], attacker: int, vct: bool, node_limit: int):
+        self.rows, self.cols = board.shape
+        self.cells = board.ravel().tolist()
+        self.attacker = attacker
+        self.defender = (attacker % 2) + 1
+        self.vct = vct
+        self.node_limit = node_limit
+        self.nodes = 0
+
+        num_windows, self.cell_windows = board_windows(self.rows, self.cols)
+        self.window_cells = board_window_cells(self.rows, self.cols)
+        self.counts = [None, [0] * num_windows, [0] * num_windows]
+        # open_windows[player][k]: windows with k stones of player and none of the opponent
+        self.open_windows = [None] + [[set() for _ in range(6)] for _ in range(2)]
+        for w in range(num_windows):
+            self.open_windows[1][0].add(w)
+            self.open_windows[2][0].add(w)
+        self.zobrist = zobrist_table(self.rows, self.cols)
+        self.key = 0
+        for idx, player in enumerate(self.cells):
+            if player:
+                self.cells[idx] = 0
+                self.place(idx, player)
+
+        # attack nodes by key: (fewest moves proven to win, most moves proven not to win)
+        self.proven: dict[int, tuple[int | None, int]] = {}
+        self.best_moves: dict[int, int] = {}
+
+    def place(self, idx: int, player: int) -> None:
+        self._update(idx, player, 1)
+
+    def remove(self, idx: int, player: int) -> None:
+        self._update(idx, player, -1)
+
+    def _update(self, idx: int, player: int, step: int) -> None:
+        self.cells[idx] = player if step > 0 else 0
+        self.key ^= self.zobrist[player][idx]
+        opponent = (player % 2) + 1
+        own, other = self.counts[player], self.counts[opponent]
+        own_open, other_open = self.open_windows[player], self.open_windows[opponent]
+        for w in self.cell_windows[idx]:
+            if other[w] == 0:
+                own_open[own[w]].discard(w)
+            if own[w] == 0:
+                other_open[other[w]].discard(w)
+            own[w] += step
+            if other[w] == 0:
+                own_open[own[w]].add(w)
+            if own[w] == 0:
+                other_open[other[w]].add(w)
+
+    def _empty_cells(self, windows) -> set[int]:
+        cells = self.cells
+        return {idx for w in windows for idx in self.window_cells[w] if cells[idx] == 0}
+
+    def five_cells(self, player: int) -> set[int]:
+        return self._empty_cells(self.open_windows[player][4])
+
+    def four_moves(self, player: int) -> set[int]:
+        return self._empty_cells(self.open_windows[player][3])
+
+    def new_five_cells(self, idx: int, player: int) -> set[int]:
+        """
+        Cells that would complete five for player after a stone at the empty cell idx
+        (without the five cells player has already).
+        """
+        cells, window_cells = self.cells, self.window_cells
+        own, other = self.counts[player], self.counts[(player % 2) + 1]
+        return {
+            cell
+            for w in self.cell_windows[idx]
+            if own[w] == 3 and other[w] == 0
+            for cell in window_cells[w]
+            if cells[cell] == 0 and cell != idx
+        }
+
+    def threat_moves(self, player: int) -> dict[int, set[int]]:
+        """
+        Moves of player that create at least two cells completing five (open four or double four),
+        with those cells.
+        """
+        threats = {}
+        for idx in self.four_moves(player):
+            fives = self.new_five_cells(idx, player)
+            if len(fives) >= 2:
+                threats[idx] = fives
+        return threats
+
+    def _attack_moves(self) -> list[int]:
+        p = self.attacker
+        fours = sorted(self.four_moves(p), key=lambda idx: -len(self.new_five_cells(idx, p)))
+        if not self.vct:
+            return fours
+        threes = []
+        for idx in self._empty_cells(self.open_windows[p][2]) - set(fours):
+            self.place(idx, p)
+            num_threats = len(self.threat_moves(p))
+            self.remove(idx, p)
+            if num_threats:
+                threes.append((num_threats, idx))
+        threes.sort(reverse=True)
+        return fours + [idx for _, idx in threes]
+
+    def attack(self, moves_left: int) -> bool:
+        """
+        Attacker to move: True if it wins with at most moves_left own moves (the five included).
+        """
+        self.nodes += 1
+        if self.nodes > self.node_limit:
+            raise _NodeLimitReached
+
+        attacker_fives = self.five_cells(self.attacker)
+        if attacker_fives:
+            self.best_moves[self.key] = min(attacker_fives)
+            return True
+        if moves_left <= 1:
+            return False
+
+        win_at, fail_at = self.proven.get(self.key, (None, 0))
+        if win_at is not None and win_at <= moves_left:
+            return True
+        if moves_left <= fail_at:
+            return False
+
+        defender_fives = self.five_cells(self.defender)
+        if len(defender_fives) >= 2:
+            won = False
+        else:
+            # a four of the defender has to be blocked, that block has to be a threat itself
+            moves = list(defender_fives) if defender_fives else self._attack_moves()
+            won = False
+            for idx in moves:
+                self.place(idx, self.attacker)
+                won = self.defend(moves_left)
+                self.remove(idx, self.attacker)
+                if won:
+                    self.best_moves[self.key] = idx
+                    break
+
+        if won:
+            self.proven[self.key] = (moves_left if win_at is None else min(win_at, moves_left), fail_at)
+        else:
+            self.proven[self.key] = (win_at, max(fail_at, moves_left))
+        return won
+
+    def defend(self, moves_left: int) -> bool:
+        """
+        Defender to move after an attacker move: True if the attacker wins against every reply.
+        """
+        if self.five_cells(self.defender):
+            return False
+        attacker_fives = self.five_cells(self.attacker)
+        if len(attacker_fives) >= 2:
+            return True
+        if attacker_fives:
+            replies = attacker_fives
+        elif self.vct:
+            threats = self.threat_moves(self.attacker)
+            if not threats:
+                return False
+            replies = set(threats).union(*threats.values()) | self.four_moves(self.defender)
+        else:
+            return False
+
+        for idx in replies:
+            self.place(idx, self.defender)
+            won = self.attack(moves_left - 1)
+            self.remove(idx, self.defender)
+            if not won:
+                return False
+        return True
+
+
+def _solve(board: npt.NDArray[np.int8], player: int, vct: bool, max_moves: int, node_limit: int) -> ThreatResult:
+    if player not in (1, 2):
+        raise ValueError("player must be either 1 or 2")
+    cache_key = (board_key(board), board.shape, player, vct, max_moves, node_limit)
+    result = _result_cache.get(cache_key)
+    if result is not None:
+        _result_cache.move_to_end(cache_key)
+        return result
+
+    search = _ThreatSearch(board, player, vct, node_limit)
+    try:
+        # increasing number of moves, so the first proof is the shortest forced win
+        for moves in range(1, max_moves + 1):
+            if search.attack(moves):
+                move = divmod(search.best_moves[search.key], search.cols)
+                result = ThreatResult(win=True, move=(int(move[0]), int(move[1])), moves=moves, nodes=search.nodes)
+                break
+        else:
+            result = ThreatResult(win=False, move=None, moves=None, nodes=search.nodes)
+    except _NodeLimitReached:
+        result = ThreatResult(win=None, move=None, moves=None, nodes=search.nodes)
+
+    _result_cache[cache_key] = result
+    if len(_result_cache) > _RESULT_CACHE_SIZE:
+        _result_cache.popitem(last=False)
+    return result
+
+
+def five_moves(board: npt.NDArray[np.int8], player: int) -> list[tuple[int, int]]:
+    """
+    All moves of player that complete five in a row, in row-major order.
+    """
+    if player not in (1, 2):
+        raise ValueError("player must be either 1 or 2")
+    search = _ThreatSearch(board, player, False, 0)
+    return sorted((int(y), int(x)) for y, x in (divmod(idx, search.cols) for idx in search.five_cells(player)))
+
+
+def solve_vcf(
+    board: npt.NDArray[np.int8], player: int, max_moves: int = 10, node_limit: int = 20_000
+) -> ThreatResult:
+    """
+    Forced win of player (to move) by continuous fours within max_moves own moves.
+    """
+    return _solve(board, player, False, max_moves, node_limit)
+
+
+def solve_vct(
+    board: npt.NDArray[np.int8], player: int, max_moves: int = 6, node_limit: int = 20_000
+) -> ThreatResult:
+    """
+    Forced win of player (to move) by continuous fours and threes within max_moves own moves.
+    """
+    return _solve(board, player, True, max_moves, node_limit)
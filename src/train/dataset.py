@@ -1,9 +1,24 @@
 from io import BytesIO
+from pathlib import PurePosixPath
 
 from datasets import Dataset, load_dataset
 from PIL import Image
 
 
+def _with_img_bytes(ds: Dataset, file_path: str) -> Dataset:
+    """
+    Datasets written with an images table (the default of gen_dataset.runner) reference
+    their images via img_id, the images are stored once in the images.parquet next to file_path.
+    """
+    if "img_bytes" in ds.column_names:
+        return ds
+
+    images_path = str(PurePosixPath(file_path).parent / "images.parquet")
+    images = load_dataset("eganscha/gomoku_vlm_ds", data_files={"images": images_path})["images"]
+    img_bytes = dict(zip(images["img_id"], images["img_bytes"]))
+    return ds.map(lambda batch: {"img_bytes": [img_bytes[i] for i in batch["img_id"]]}, batched=True)
+
+
 def load_our_dataset(file_path: str, eval_path: str | None) -> tuple[Dataset, Dataset]:
     if eval_path is not None:
         ds = load_dataset(
@@ -13,15 +28,15 @@ def load_our_dataset(file_path: str, eval_path: str | None) -> tuple[Dataset, Da
                 "eval": eval_path,
             },
         )
-        train_ds = ds["train"]
-        eval_ds = ds["eval"]
+        train_ds = _with_img_bytes(ds["train"], file_path)
+        eval_ds = _with_img_bytes(ds["eval"], eval_path)
     else:
         ds = load_dataset(
             "eganscha/gomoku_vlm_ds",
             data_files={"train": file_path},
         )
 
-        split = ds["train"].train_test_split(
+        split = _with_img_bytes(ds["train"], file_path).train_test_split(
             test_size=0.1,
             seed=42,
         )
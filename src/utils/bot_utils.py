@@ -1,5 +1,10 @@
+import random
+from functools import lru_cache
+
 import numpy as np
 
+ZOBRIST_SEED = 0x5EED_B0B
+
 DIRECTIONS = [(1, 0), (0, 1), (1, 1), (1, -1)]
 PATTERN_WEIGHTS = {5: 1_000_000, 4: 10_000, 3: 1000, 2: 100, 1: 10, 0: 0}
 
@@ -27,6 +32,203 @@ def generate_moves(board: np.ndarray, radius: int = 2) -> list[tuple[int, int]]:
     return moves
 
 
-def board_key(board: np.ndarray) -> bytes:
-    # todo: improve
-    return board.tobytes()
+# xor-ed into a position key to tell apart searches for player 1 and 2,
+# SEARCH_KEYS[us][maximizing] (index 0 unused)
+_search_rng = random.Random(ZOBRIST_SEED)
+SEARCH_KEYS = ((0, 0), *((_search_rng.getrandbits(64), _search_rng.getrandbits(64)) for _ in range(2)))
+
+
+@lru_cache(maxsize=None)
+def zobrist_table(rows: int, cols: int) -> tuple[list[int], list[int], list[int]]:
+    """
+    Random 64 bit keys, table[player][y * cols + x] for player 1 and 2.
+    table[0] is all zeros, so empty cells do not change a key.
+    """
+    rng = random.Random(ZOBRIST_SEED ^ (rows << 16) ^ cols)
+    return (
+        [0] * (rows * cols),
+        [rng.getrandbits(64) for _ in range(rows * cols)],
+        [rng.getrandbits(64) for _ in range(rows * cols)],
+    )
+
+
+def board_key(board: np.ndarray) -> int:
+    """
+    Zobrist hash of the board: xor of zobrist_table(*board.shape)[player][y * cols + x] over all stones.
+    Placing or removing a stone at (y, x) changes it by xor with that single entry.
+    """
+    table = zobrist_table(*board.shape)
+    key = 0
+    for idx, player in enumerate(board.ravel().tolist()):
+        key ^= table[player][idx]
+    return key
+
+
+# value of a 5-cell window by (black stones, white stones) in it, from black's point of view:
+# only windows that still can become five for one player count
+WINDOW_VALUES = [
+    [PATTERN_WEIGHTS[b] if w == 0 else (-PATTERN_WEIGHTS[w] if b == 0 else 0) for w in range(6)]
+    for b in range(6)
+]
+
+
+@lru_cache(maxsize=None)
+def board_windows(rows: int, cols: int, n: int = 5) -> tuple[int, list[list[int]]]:
+    """
+    Returns (number of windows, cell_windows) for all windows of n cells along DIRECTIONS,
+    cell_windows[y * cols + x] lists the windows that contain (y, x).
+    """
+    cell_windows: list[list[int]] = [[] for _ in range(rows * cols)]
+    num_windows = 0
+    for dy, dx in DIRECTIONS:
+        for y in range(rows):
+            for x in range(cols):
+                end_y, end_x = y + (n - 1) * dy, x + (n - 1) * dx
+                if not (0 <= end_y < rows and 0 <= end_x < cols):
+                    continue
+                for i in range(n):
+                    cell_windows[(y + i * dy) * cols + x + i * dx].append(num_windows)
+                num_windows += 1
+    return num_windows, cell_windows
+
+
+@lru_cache(maxsize=None)
+def board_window_cells(rows: int, cols: int, n: int = 5) -> list[tuple[int, ...]]:
+    """
+    The cells (y * cols + x) of every window of board_windows(rows, cols, n), by window.
+    """
+    num_windows, cell_windows = board_windows(rows, cols, n)
+    window_cells: list[list[int]] = [[] for _ in range(num_windows)]
+    for idx, windows in enumerate(cell_windows):
+        for w in windows:
+            window_cells[w].append(idx)
+    return [tuple(cells) for cells in window_cells]
+
+
+class PatternEvaluator:
+    """
+    Incremental pattern evaluation of a board (1 = black, 2 = white).
+
+    Every window of 5 cells along the four directions scores PATTERN_WEIGHTS[count]
+    for the player owning all of its count stones (see WINDOW_VALUES).
+    The stone counts per window are kept up to date by place / remove,
+    which only touch the (at most 20) windows through the changed cell.
+    """
+
+    def __init__(self, board: np.ndarray):
+        self.rows, self.cols = board.shape
+        num_windows, self.cell_windows = board_windows(self.rows, self.cols)
+        # counts[player][window], index 0 unused
+        self.counts = [None, [0] * num_windows, [0] * num_windows]
+        self.fives = [0, 0, 0]  # windows completely filled by player
+        self.black_score = 0  # sum of WINDOW_VALUES over all windows
+        for idx, player in enumerate(board.ravel().tolist()):
+            if player:
+                self.place(*divmod(idx, self.cols), player)
+
+    def score(self, us: int) -> int:
+        return self.black_score if us == 1 else -self.black_score
+
+    def has_won(self, player: int) -> bool:
+        return self.fives[player] > 0
+
+    def move_delta(self, y: int, x: int, player: int) -> int:
+        """
+        Change of score(1) if player placed a stone at the empty cell (y, x).
+        """
+        black, white = self.counts[1], self.counts[2]
+        delta = 0
+        for w in self.cell_windows[y * self.cols + x]:
+            b, wh = black[w], white[w]
+            if player == 1:
+                delta += WINDOW_VALUES[b + 1][wh] - WINDOW_VALUES[b][wh]
+            else:
+                delta += WINDOW_VALUES[b][wh + 1] - WINDOW_VALUES[b][wh]
+        return delta
+
+    def place(self, y: int, x: int, player: int) -> None:
+        self._update(y * self.cols + x, player, 1)
+
+    def remove(self, y: int, x: int, player: int) -> None:
+        self._update(y * self.cols + x, player, -1)
+
+    def _update(self, idx: int, player: int, step: int) -> None:
+        black, white = self.counts[1], self.counts[2]
+        own = self.counts[player]
+        score = self.black_score
+        for w in self.cell_windows[idx]:
+            score -= WINDOW_VALUES[black[w]][white[w]]
+            if own[w] == 5:
+                self.fives[player] -= 1
+            own[w] += step
+            if own[w] == 5:
+                self.fives[player] += 1
+            score += WINDOW_VALUES[black[w]][white[w]]
+        self.black_score = score
+
+
+@lru_cache(maxsize=None)
+def neighborhoods(rows: int, cols: int, radius: int) -> list[tuple[int, ...]]:
+    """
+    neighborhoods[y * cols + x]: the cells (y' * cols + x') with max(|y - y'|, |x - x'|) <= radius, (y, x) included.
+    """
+    result = []
+    for y in range(rows):
+        for x in range(cols):
+            result.append(tuple(
+                ny * cols + nx
+                for ny in range(max(0, y - radius), min(rows, y + radius + 1))
+                for nx in range(max(0, x - radius), min(cols, x + radius + 1))
+            ))
+    return result
+
+
+class CandidateMoves:
+    """
+    Incrementally maintained version of generate_moves.
+
+    refcount[y * cols + x] is the number of stones within radius of (y, x),
+    the candidates are the empty cells with a positive refcount.
+    place / remove update the (2 * radius + 1) ** 2 cells around the changed cell.
+    """
+
+    def __init__(self, board: np.ndarray, radius: int = 2):
+        self.rows, self.cols = board.shape
+        self.neighborhoods = neighborhoods(self.rows, self.cols, radius)
+        self.occupied = [False] * board.size
+        self.refcount = [0] * board.size
+        self.candidates: set[int] = set()
+        self.num_stones = 0
+        for idx in np.flatnonzero(board).tolist():
+            self.place(*divmod(idx, self.cols))
+
+    def place(self, y: int, x: int) -> None:
+        idx = y * self.cols + x
+        refcount, occupied, candidates = self.refcount, self.occupied, self.candidates
+        occupied[idx] = True
+        candidates.discard(idx)
+        self.num_stones += 1
+        for n in self.neighborhoods[idx]:
+            refcount[n] += 1
+            if refcount[n] == 1 and not occupied[n]:
+                candidates.add(n)
+
+    def remove(self, y: int, x: int) -> None:
+        idx = y * self.cols + x
+        refcount, occupied, candidates = self.refcount, self.occupied, self.candidates
+        occupied[idx] = False
+        self.num_stones -= 1
+        for n in self.neighborhoods[idx]:
+            refcount[n] -= 1
+            if refcount[n] == 0:
+                candidates.discard(n)
+        if refcount[idx] > 0:
+            candidates.add(idx)
+
+    def moves(self) -> list[tuple[int, int]]:
+        """
+        Same moves in the same (row-major) order as generate_moves(board, radius).
+        """
+        if self.num_stones == 0:
+            return [(self.rows // 2, self.cols // 2)]  # first move always center
+        return [divmod(idx, self.cols) for idx in sorted(self.candidates)]
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from game_logic import has_player_won
+from utils.bot_utils import DIRECTIONS, PATTERN_WEIGHTS, CandidateMoves, PatternEvaluator, generate_moves
+
+
+def random_board(rng, stones, size=15):
+    board = np.zeros((size, size), dtype=np.int8)
+    cells = rng.choice(size * size, size=stones, replace=False)
+    for i, idx in enumerate(cells):
+        board.flat[idx] = 1 + i % 2
+    return board
+
+
+def window_score(board):
+    """
+    Score of black straight from the definition: every 5-cell window owned by a single player.
+    """
+    rows, cols = board.shape
+    score = 0
+    for dy, dx in DIRECTIONS:
+        for y in range(rows):
+            for x in range(cols):
+                if not (0 <= y + 4 * dy < rows and 0 <= x + 4 * dx < cols):
+                    continue
+                cells = [board[y + i * dy, x + i * dx] for i in range(5)]
+                black, white = cells.count(1), cells.count(2)
+                if white == 0:
+                    score += PATTERN_WEIGHTS[black]
+                elif black == 0:
+                    score -= PATTERN_WEIGHTS[white]
+    return score
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_pattern_evaluator_matches_window_score(seed):
+    rng = np.random.default_rng(seed)
+    board = random_board(rng, 10 + 15 * seed)
+    evaluator = PatternEvaluator(board)
+    assert evaluator.score(1) == window_score(board)
+    assert evaluator.score(2) == -window_score(board)
+    for player in (1, 2):
+        assert evaluator.has_won(player) == has_player_won(board, 5, player)
+
+
+def test_pattern_evaluator_incremental_updates():
+    rng = np.random.default_rng(42)
+    board = random_board(rng, 20)
+    evaluator = PatternEvaluator(board)
+    initial = evaluator.score(1)
+    played = []
+    for idx in rng.permutation(np.flatnonzero(board == 0))[:40].tolist():
+        y, x = divmod(idx, board.shape[1])
+        player = int(rng.integers(1, 3))
+        before = evaluator.score(1)
+        delta = evaluator.move_delta(y, x, player)
+        board[y, x] = player
+        evaluator.place(y, x, player)
+        played.append((y, x, player))
+        assert evaluator.score(1) == before + delta
+        assert evaluator.score(1) == PatternEvaluator(board).score(1)
+        assert evaluator.has_won(player) == has_player_won(board, 5, player)
+    for y, x, player in reversed(played):
+        board[y, x] = 0
+        evaluator.remove(y, x, player)
+    assert evaluator.score(1) == initial
+    for player in (1, 2):
+        assert evaluator.has_won(player) == has_player_won(board, 5, player)
+
+
+def test_pattern_evaluator_five():
+    board = np.zeros((15, 15), dtype=np.int8)
+    evaluator = PatternEvaluator(board)
+    for i in range(5):
+        board[3 + i, 10 - i] = 2
+        evaluator.place(3 + i, 10 - i, 2)
+    assert evaluator.has_won(2) and not evaluator.has_won(1)
+    evaluator.remove(7, 6, 2)
+    assert not evaluator.has_won(2)
+
+
+@pytest.mark.parametrize("radius", [1, 2])
+def test_candidate_moves_match_generate_moves(radius):
+    rng = np.random.default_rng(radius)
+    for stones in (0, 1, 7, 40, 150):
+        board = random_board(rng, stones)
+        assert CandidateMoves(board, radius).moves() == generate_moves(board, radius)
+
+
+def test_candidate_moves_place_remove():
+    rng = np.random.default_rng(7)
+    board = np.zeros((15, 15), dtype=np.int8)
+    candidates = CandidateMoves(board)
+    played = []
+    for step in range(120):
+        # mostly place, sometimes take back the last stones (like a search does)
+        if played and rng.random() < 0.3:
+            y, x = played.pop()
+            board[y, x] = 0
+            candidates.remove(y, x)
+        else:
+            y, x = divmod(int(rng.choice(np.flatnonzero(board == 0))), 15)
+            board[y, x] = 1 + step % 2
+            candidates.place(y, x)
+            played.append((y, x))
+        assert candidates.moves() == generate_moves(board)
+    for y, x in reversed(played):
+        board[y, x] = 0
+        candidates.remove(y, x)
+    assert candidates.moves() == generate_moves(board) == [(7, 7)]
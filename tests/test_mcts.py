@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from gobang.algorithm.ai import pattern_value
+from gobang.algorithm.mcts import BatchedMCTS
+from gobang.game import GameState
+
+
+class UniformPolicy:
+    """
+    Same prior for every legal move, records the number of states per batch_eval_state call.
+    """
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def batch_eval_state(self, states):
+        self.batch_sizes.append(len(states))
+        result = []
+        for state in states:
+            moves = state.get_legal_moves()
+            result.append([(move, 1.0 / len(moves)) for move in moves])
+        return result
+
+
+def position(black, white, size=15):
+    board = np.zeros((size, size), dtype=int)
+    for x, y in black:
+        board[x, y] = 1
+    for x, y in white:
+        board[x, y] = -1
+    return GameState(size, board, False, False)
+
+
+# black four, blocked at (7, 6): the only open end is (7, 11)
+FOUR_BLACK = [(7, 7), (7, 8), (7, 9), (7, 10)]
+FOUR_WHITE = [(7, 6), (2, 2), (2, 12), (12, 2)]
+
+
+@pytest.mark.parametrize("batch_size", [1, 8])
+def test_batched_mcts_takes_immediate_win(batch_size):
+    mcts = BatchedMCTS(UniformPolicy(), pattern_value, n_playout=200, batch_size=batch_size)
+    assert mcts.get_move(position(FOUR_BLACK, FOUR_WHITE)) == (7, 11)
+
+
+@pytest.mark.parametrize("batch_size", [1, 8])
+def test_batched_mcts_blocks_four(batch_size):
+    mcts = BatchedMCTS(UniformPolicy(), pattern_value, n_playout=200, batch_size=batch_size)
+    assert mcts.get_move(position(FOUR_BLACK + [(0, 0)], FOUR_WHITE)) == (7, 11)
+
+
+def test_batched_mcts_fills_batches():
+    policy = UniformPolicy()
+    mcts = BatchedMCTS(policy, pattern_value, n_playout=400, batch_size=8)
+    mcts.get_move(position([(7, 7), (8, 8)], [(7, 8)]))
+    # the first call only has the root, collisions on pending leaves do not end a batch early
+    assert policy.batch_sizes[0] == 1
+    assert np.mean(policy.batch_sizes[1:]) > 7
+
+
+def test_update_with_move_advances_root():
+    state = position([(7, 7), (8, 8)], [(7, 8)])
+    mcts = BatchedMCTS(UniformPolicy(), pattern_value, n_playout=200, batch_size=8)
+    move = mcts.get_move(state)
+    old_root = mcts._root
+
+    mcts.update_with_move(move)
+    assert mcts.parent[mcts._root] == old_root
+    assert divmod(int(mcts.action[mcts._root]), state.size) == move
+    visits = mcts.N[mcts._root]
+    assert visits > 0
+
+    # the next search continues in the kept subtree
+    state.do_move(move)
+    mcts.get_move(state)
+    assert mcts.parent[mcts._root] == old_root
+    assert mcts.N[mcts._root] > visits
+
+    # a move outside the tree discards it at the next get_move
+    mcts.update_with_move(None)
+    mcts.get_move(state)
+    assert mcts._root == 0
+
+
+def test_batched_mcts_needs_a_budget():
+    with pytest.raises(ValueError):
+        BatchedMCTS(UniformPolicy(), pattern_value, n_playout=None, time_limit=None)
@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+
+from bots.minmax_bot import (
+    MINIMAX_MAX_DEPTH,
+    MinimaxSearch,
+    TranspositionTable,
+    generate_next_move_minimax,
+    search_best_move,
+)
+from utils.bot_utils import PATTERN_WEIGHTS, PatternEvaluator, board_key, generate_moves, zobrist_table
+
+
+def random_board(rng, stones, size=15):
+    """
+    stones alternating black / white on random cells around the center, no five.
+    """
+    board = np.zeros((size, size), dtype=np.int8)
+    player = 1
+    while stones:
+        y, x = rng.integers(4, size - 4, size=2)
+        if board[y, x]:
+            continue
+        board[y, x] = player
+        if PatternEvaluator(board).has_won(player):
+            board[y, x] = 0
+            continue
+        player = 3 - player
+        stones -= 1
+    return board
+
+
+def make_board(black=(), white=(), size=15):
+    board = np.zeros((size, size), dtype=np.int8)
+    for y, x in black:
+        board[y, x] = 1
+    for y, x in white:
+        board[y, x] = 2
+    return board
+
+
+# black four on row 7, blocked at (7, 6): the only open end is (7, 11)
+FOUR_BLACK = [(7, 7), (7, 8), (7, 9), (7, 10)]
+FOUR_WHITE = [(7, 6), (2, 2), (2, 12), (12, 2)]
+
+
+def plain_minimax(board, evaluator, depth, us, maximizing):
+    """
+    Reference search without pruning, transposition table or move ordering.
+    """
+    them = 3 - us
+    if evaluator.has_won(us):
+        return PATTERN_WEIGHTS[5]
+    if evaluator.has_won(them):
+        return -PATTERN_WEIGHTS[5]
+    if depth == 0:
+        return evaluator.score(us)
+    moves = generate_moves(board)
+    if not moves:
+        return 0
+    cur = us if maximizing else them
+    values = []
+    for y, x in moves:
+        board[y, x] = cur
+        evaluator.place(y, x, cur)
+        values.append(plain_minimax(board, evaluator, depth - 1, us, not maximizing))
+        evaluator.remove(y, x, cur)
+        board[y, x] = 0
+    return max(values) if maximizing else min(values)
+
+
+def test_board_key_is_incremental():
+    rng = np.random.default_rng(0)
+    board = random_board(rng, 12)
+    table = zobrist_table(*board.shape)
+    key = board_key(board)
+    for y, x in generate_moves(board)[:10]:
+        for player in (1, 2):
+            board[y, x] = player
+            assert board_key(board) == key ^ table[player][y * board.shape[1] + x]
+            board[y, x] = 0
+    assert board_key(board) == key
+    assert board_key(np.zeros_like(board)) == 0
+
+
+@pytest.mark.parametrize("seed, stones, depth", [(0, 6, 2), (1, 9, 2), (2, 4, 3)])
+def test_transposition_table_keeps_minimax_value(seed, stones, depth):
+    rng = np.random.default_rng(seed)
+    board = random_board(rng, stones)
+    us = 1 if stones % 2 == 0 else 2
+    expected = plain_minimax(board.copy(), PatternEvaluator(board), depth, us, True)
+
+    transposition = TranspositionTable(size_log2=10)  # small table: collisions and replacements happen
+    for _ in range(2):  # the second search starts from the entries of the first
+        result = MinimaxSearch(board, us, transposition).iterative_deepening(depth)
+        assert result.depth == depth
+        assert result.score == expected
+
+
+def test_minimax_takes_immediate_win():
+    board = make_board(FOUR_BLACK, FOUR_WHITE)
+    result = search_best_move(board, 1, 4, transposition=TranspositionTable(size_log2=12))
+    assert result.move == (7, 11)
+    assert result.score == PATTERN_WEIGHTS[5]
+    assert result.depth == 1  # a won position ends the iterations
+    assert generate_next_move_minimax(board) == (7, 11)
+
+
+def test_minimax_blocks_four():
+    board = make_board(FOUR_BLACK + [(0, 0)], FOUR_WHITE)
+    result = search_best_move(board, 2, 2, transposition=TranspositionTable(size_log2=12))
+    assert result.move == (7, 11)
+    assert result.score > -PATTERN_WEIGHTS[5]
+    assert generate_next_move_minimax(board) == (7, 11)
+
+
+def test_node_limit_is_respected_and_deterministic():
+    board = random_board(np.random.default_rng(3), 10)
+    first, second = (
+        search_best_move(board, 1, MINIMAX_MAX_DEPTH, transposition=TranspositionTable(size_log2=12), node_limit=3000)
+        for _ in range(2)
+    )
+    assert 1 <= first.depth < MINIMAX_MAX_DEPTH
+    assert first.nodes <= 3000
+    assert len(first.pv) <= first.depth and first.pv[0] == first.move
+    assert (second.move, second.score, second.depth, second.nodes) == (
+        first.move, first.score, first.depth, first.nodes
+    )
+
+    # the result is the one of the deepest completed iteration
+    complete = search_best_move(board, 1, first.depth, transposition=TranspositionTable(size_log2=12))
+    assert complete.score == first.score
+
+
+def test_time_limit_completes_depth_one():
+    board = random_board(np.random.default_rng(4), 10)
+    transposition = TranspositionTable(size_log2=12)
+    result = search_best_move(board, 1, MINIMAX_MAX_DEPTH, transposition=transposition, time_limit=1e-6)
+    assert result.depth == 1
+    assert result.move is not None
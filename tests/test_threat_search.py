@@ -0,0 +1,50 @@
+import numpy as np
+
+from threat_search import five_moves, solve_vcf, solve_vct
+
+
+def make_board(black=(), white=(), size=15):
+    board = np.zeros((size, size), dtype=np.int8)
+    for y, x in black:
+        board[y, x] = 1
+    for y, x in white:
+        board[y, x] = 2
+    return board
+
+
+# black to move: (7, 8) makes two fours at once (row 7 and column 8), both ends already blocked once
+DOUBLE_FOUR = make_board(
+    black=[(7, 5), (7, 6), (7, 7), (4, 8), (5, 8), (6, 8)],
+    white=[(7, 4), (3, 8), (0, 0), (0, 14), (14, 0), (14, 14)],
+)
+
+
+def test_five_moves_open_four():
+    board = make_board(black=[(7, 5), (7, 6), (7, 7), (7, 8)], white=[(0, 0), (0, 1), (0, 2)])
+    assert five_moves(board, 1) == [(7, 4), (7, 9)]
+    assert five_moves(board, 2) == []
+
+
+def test_vcf_double_four():
+    result = solve_vcf(DOUBLE_FOUR, 1)
+    assert result.win is True
+    assert result.move == (7, 8)
+    assert result.moves == 2
+
+
+def test_vcf_no_win_for_defender():
+    result = solve_vcf(DOUBLE_FOUR, 2)
+    assert result.win is False
+    assert result.move is None
+
+
+def test_vcf_immediate_five():
+    board = make_board(black=[(7, 5), (7, 6), (7, 7), (7, 8)], white=[(7, 4), (0, 0), (0, 1), (0, 2)])
+    result = solve_vcf(board, 1)
+    assert (result.win, result.move, result.moves) == (True, (7, 9), 1)
+
+
+def test_vct_finds_the_vcf_win():
+    result = solve_vct(DOUBLE_FOUR, 1)
+    assert result.win is True
+    assert result.moves == 2